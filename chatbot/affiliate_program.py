@@ -1,7 +1,5 @@
 from telegram import (
     Update,
-    InlineKeyboardButton,
-    InlineKeyboardMarkup,
     ReplyKeyboardRemove,
 )
 
@@ -10,6 +8,7 @@ from telegram.ext import (
 )
 
 import chatbot.globals as gl
+import chatbot.keyboards as keyboards
 from chatbot.start import start
 from chatbot.registration import finish_registration_menu
 
@@ -21,14 +20,9 @@ async def affiliate_program_info(update: Update, context: ContextTypes.DEFAULT_T
         reply_markup=ReplyKeyboardRemove()
     )
 
-    keyboard = [
-        [InlineKeyboardButton(gl.BACK_BUTTON_NAME, callback_data=gl.BACK_BUTTON_NAME)]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-
     await update.message.reply_text(
         text=gl.TEXT_DATA["affiliate_program_info"],
-        reply_markup=reply_markup,
+        reply_markup=keyboards.BACK,
         parse_mode="HTML"
     )
     return gl.AFFILIATE_PROGRAM_INFO_MENU
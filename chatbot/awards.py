@@ -1,9 +1,6 @@
 from telegram import (
     Update,
-    InlineKeyboardButton,
-    InlineKeyboardMarkup,
-    ReplyKeyboardRemove,
-    InputMediaPhoto
+    ReplyKeyboardRemove
 )
 
 from telegram.ext import (
@@ -11,6 +8,8 @@ from telegram.ext import (
 )
 
 import chatbot.globals as gl
+import chatbot.keyboards as keyboards
+import chatbot.media as media
 from chatbot.start import start
 from chatbot.registration import finish_registration_menu
 
@@ -23,16 +22,11 @@ async def awards_info(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
     )
 
     chat_id = update.effective_chat.id
-    image = gl.TEXT_DATA["awards_image_path"]
-    media_group = [InputMediaPhoto(open(image_path, 'rb')) for image_path in gl.get_all_file_paths(image)]
-    await context.bot.send_media_group(chat_id=chat_id, media=media_group)
-
-    keyboard = [[InlineKeyboardButton(gl.BACK_BUTTON_NAME, callback_data=gl.BACK_BUTTON_NAME)]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    await media.send_gallery(context.bot, chat_id, gl.TEXT_DATA["awards_image_path"])
 
     await update.message.reply_text(
         text=gl.TEXT_DATA["awards_info"],
-        reply_markup=reply_markup,
+        reply_markup=keyboards.BACK,
         parse_mode="HTML"
     )
     return gl.AWARDS_MENU
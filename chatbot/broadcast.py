@@ -0,0 +1,334 @@
+"""
+This script is a part of a Telegram bot that delivers admin broadcasts to all users.
+A broadcast is a single job: recipients are read from the database in pages and
+served by a bounded number of workers, every request waits for a token from the
+global and the per-chat rate limiters, flood control errors are retried after the
+delay Telegram asks for, and the delivery counts are reported to the admin at the end.
+The outcome of every delivery is written to the delivery ledger, and users who can no
+longer be reached are left out of the next broadcasts.
+"""
+import asyncio
+import functools
+import logging
+import time
+from collections import Counter
+
+from telegram import Bot, InputMediaPhoto
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError
+from telegram.ext import ContextTypes
+
+import chatbot.globals as gl
+import chatbot.lifecycle as lifecycle
+import db.async_database as adb
+from db.delivery_ledger import delivery_ledger
+from db.user_buffer import user_buffer
+
+logger = logging.getLogger(__name__)
+
+SENT, BLOCKED, FAILED = "sent", "blocked", "failed"
+
+
+def is_permanent(error: TelegramError) -> bool:
+    """Tell whether the error repeats for every message to the chat."""
+    # The user blocked the bot or deleted the account, or the chat no longer exists
+    return isinstance(error, Forbidden) or (isinstance(error, BadRequest)
+                                            and "chat not found" in error.message.lower())
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter.
+
+    Args:
+        rate (float): Tokens added per second.
+        capacity (float): Maximum number of tokens, i.e. the allowed burst.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def pause(self, seconds: float) -> None:
+        """Do not hand out tokens for the given number of seconds."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self) -> None:
+        """Wait until a token is available and take it."""
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class Delivery:
+    """
+    Outcome of the delivery to one chat.
+
+    Args:
+        chat_id (int): Recipient chat.
+    """
+
+    def __init__(self, chat_id: int):
+        self.chat_id = chat_id
+        self.state = SENT
+        self.error = None  # Class name of the Telegram error that ended the delivery
+        self.attempts = 0
+        self.started = time.monotonic()
+        self.latency = 0.0
+
+
+class BroadcastReport:
+    """Delivery counts of a broadcast and the state of every recipient that did not get it."""
+
+    def __init__(self):
+        self.counts = Counter()
+        self.undelivered = {}
+        self.started = time.monotonic()
+        self.finished = None
+        self.interrupted = False
+
+    def record(self, delivery: Delivery) -> None:
+        self.counts[delivery.state] += 1
+        if delivery.state != SENT:
+            self.undelivered[delivery.chat_id] = delivery.state
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+    def text(self) -> str:
+        elapsed = self.elapsed
+        throughput = sum(self.counts.values()) / elapsed if elapsed else 0
+        return gl.TEXT_DATA["message_for_all"]["report"].format(
+            round(elapsed, 1), self.counts[SENT], self.counts[BLOCKED], self.counts[FAILED], round(throughput, 1))
+
+
+class Broadcaster:
+    """
+    Deliver the same payload to many chats within Telegram rate limits.
+
+    Args:
+        bot (Bot): Bot instance used to send the messages.
+        rate (float): Messages per second for the whole bot.
+        chat_rate (float): Messages per second to a single chat.
+        chat_burst (float): Messages a single chat may get in a row before chat_rate applies.
+        concurrency (int): Number of recipients served at the same time.
+        max_attempts (int): Attempts for a single request before the recipient is marked as failed.
+    """
+
+    def __init__(self, bot: Bot, rate=gl.BROADCAST_RATE, chat_rate=gl.BROADCAST_CHAT_RATE,
+                 chat_burst=gl.BROADCAST_CHAT_BURST, concurrency=gl.BROADCAST_CONCURRENCY,
+                 max_attempts=gl.BROADCAST_MAX_ATTEMPTS):
+        self.bot = bot
+        self.bucket = TokenBucket(rate, capacity=rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+
+    async def _request(self, delivery: Delivery, chat_bucket: TokenBucket, method, **kwargs):
+        for attempt in range(1, self.max_attempts + 1):
+            delivery.attempts += 1
+            await chat_bucket.acquire()
+            await self.bucket.acquire()
+            try:
+                return await method(**kwargs)
+            except RetryAfter as error:
+                # Flood control applies to the whole bot, so every worker waits
+                logger.warning("Flood control, retrying in %s s", error.retry_after)
+                self.bucket.pause(error.retry_after)
+                chat_bucket.pause(error.retry_after)
+            except (Forbidden, BadRequest):
+                raise
+            except NetworkError as error:
+                if attempt == self.max_attempts:
+                    raise
+                logger.warning("Network error on attempt %s: %s", attempt, error)
+                await asyncio.sleep(2 ** attempt)
+        raise TelegramError(f"Request failed after {self.max_attempts} attempts")
+
+    async def deliver(self, chat_id: int, payload: dict) -> Delivery:
+        """
+        Send all parts of the payload to one chat.
+
+        Args:
+            chat_id (int): Recipient chat.
+            payload (dict): Broadcast content with "texts" and "photos" lists.
+
+        Returns:
+            Delivery: Delivery state, error, attempts and latency of the recipient.
+        """
+        delivery = Delivery(chat_id)
+        chat_bucket = TokenBucket(self.chat_rate, capacity=self.chat_burst)
+        try:
+            for text in payload["texts"]:
+                await self._request(delivery, chat_bucket, self.bot.send_message, chat_id=chat_id, text=text)
+            if payload["photos"]:
+                media_group = [InputMediaPhoto(media=file_id) for file_id in payload["photos"]]
+                await self._request(delivery, chat_bucket, self.bot.send_media_group, chat_id=chat_id,
+                                    media=media_group)
+        except TelegramError as error:
+            delivery.error = type(error).__name__
+            if is_permanent(error):
+                delivery.state = BLOCKED
+            else:
+                logger.error("Failed to deliver broadcast to %s: %s", chat_id, error)
+                delivery.state = FAILED
+        delivery.latency = time.monotonic() - delivery.started
+        return delivery
+
+    async def run(self, pages, payload: dict, on_page=None, stop: asyncio.Event = None,
+                  source: tuple = None) -> BroadcastReport:
+        """
+        Deliver the payload to every recipient.
+
+        Pages are read lazily, and the next page is started only when every recipient
+        of the previous one has been served, so on_page can persist a resume cursor.
+        Once stop is set no more recipients are started, the started ones are finished
+        and on_page gets the last served user id, so the broadcast can be resumed.
+
+        Args:
+            pages (AsyncIterable[list]): Pages of (user id, chat id) rows.
+            payload (dict): Broadcast content with "texts" and "photos" lists.
+            on_page (Callable[[int], Awaitable]): Awaited with the last user id of every finished page.
+            stop (asyncio.Event): Interrupts the broadcast when set.
+            source (tuple): (kind, id) of the job the deliveries are recorded under in the
+                delivery ledger, None records nothing.
+
+        Returns:
+            BroadcastReport: Delivery counts of the broadcast.
+        """
+        report = BroadcastReport()
+        queue = asyncio.Queue(maxsize=self.concurrency * 2)
+
+        async def worker():
+            while True:
+                chat_id = await queue.get()
+                delivery = Delivery(chat_id)
+                try:
+                    delivery = await self.deliver(chat_id, payload)
+                except Exception as error:
+                    # A bug must not stop the delivery to the other recipients
+                    logger.exception("Failed to deliver broadcast to %s", chat_id)
+                    delivery.state, delivery.error = FAILED, type(error).__name__
+                    delivery.latency = time.monotonic() - delivery.started
+                try:
+                    report.record(delivery)
+                    if delivery.state == BLOCKED:
+                        await user_buffer.deactivate(chat_id)
+                    if source:
+                        await delivery_ledger.add(*source, delivery)
+                except Exception:
+                    logger.exception("Failed to record the delivery to %s", chat_id)
+                finally:
+                    queue.task_done()
+
+        workers = set()
+
+        def start_worker():
+            task = asyncio.create_task(worker())
+            task.add_done_callback(on_worker_exit)
+            workers.add(task)
+
+        def on_worker_exit(task):
+            workers.discard(task)
+            # Workers end only when cancelled, a lost one would leave queue.join() waiting forever
+            if not task.cancelled():
+                logger.error("Broadcast worker stopped (%r), starting a new one", task.exception())
+                start_worker()
+
+        for _ in range(self.concurrency):
+            start_worker()
+        try:
+            async for page in pages:
+                last_user_id = None
+                for user_id, chat_id in page:
+                    if stop is not None and stop.is_set():
+                        report.interrupted = True
+                        break
+                    await queue.put(chat_id)
+                    last_user_id = user_id
+                await queue.join()
+                await delivery_ledger.flush()
+                if on_page and last_user_id is not None:
+                    await on_page(last_user_id)
+                if report.interrupted:
+                    break
+        finally:
+            stopped = list(workers)
+            for task in stopped:
+                task.cancel()
+            await asyncio.gather(*stopped, return_exceptions=True)
+
+        report.finished = time.monotonic()
+        if report.interrupted:
+            logger.info("Broadcast interrupted after %.1f s, %s recipients served", report.elapsed,
+                        sum(report.counts.values()))
+            return report
+        logger.info("Broadcast finished in %.1f s: %s sent, %s blocked, %s failed", report.elapsed,
+                    report.counts[SENT], report.counts[BLOCKED], report.counts[FAILED])
+        return report
+
+
+def make_payload(text_messages: str, photo_messages: str) -> dict:
+    """
+    Build the broadcast payload from the separator-joined columns stored in the database.
+
+    Args:
+        text_messages (str): Text messages joined with gl.SEPERATOR.
+        photo_messages (str): Photo file_ids joined with gl.SEPERATOR.
+
+    Returns:
+        dict: Broadcast content with "texts" and "photos" lists.
+    """
+    return {
+        "texts": [text for text in (text_messages or "").split(gl.SEPERATOR) if text],
+        "photos": [file_id for file_id in (photo_messages or "").split(gl.SEPERATOR) if file_id],
+    }
+
+
+async def broadcast_job(context: ContextTypes.DEFAULT_TYPE) -> bool:
+    """
+    Send the scheduled broadcast to all users and report the result to the admin.
+
+    The stored job only holds the id of the scheduled message. Users are read from the
+    database page by page, and the id of the last served user is stored with the
+    message, so a broadcast interrupted by a restart continues where it stopped.
+    On shutdown the broadcast stops early and the message is kept for the next start.
+
+    Args:
+        context (ContextTypes.DEFAULT_TYPE): Context object containing the stored job with the message id.
+
+    Returns:
+        bool: True if the broadcast is complete, False if it was interrupted.
+    """
+    message_id = context.job.data.entity_id
+    row = await adb.get_scheduled_message(message_id)
+    if row is None:
+        return True
+    text_messages, photo_messages, last_user_id = row
+    last_user_id = last_user_id or 0
+    await adb.set_scheduled_message_cursor(message_id, last_user_id)
+
+    report = await Broadcaster(context.bot).run(
+        adb.iter_chat_id_pages(last_user_id),
+        make_payload(text_messages, photo_messages),
+        on_page=functools.partial(adb.set_scheduled_message_cursor, message_id),
+        stop=lifecycle.stopping,
+        source=(context.job.data.kind, context.job.data.id),
+    )
+    if report.interrupted:
+        return False
+    await adb.delete_scheduled_message(message_id)
+    await context.bot.send_message(chat_id=gl.ADMIN_CHAT_ID, text=report.text())
+    return True
@@ -7,10 +7,7 @@ functions to manage state transitions and user interactions smoothly.
 
 from telegram import (
     Update,
-    InlineKeyboardButton,
-    InlineKeyboardMarkup,
-    ReplyKeyboardRemove,
-    InputMediaPhoto
+    ReplyKeyboardRemove
 )
 
 from telegram.ext import (
@@ -18,7 +15,8 @@ from telegram.ext import (
 )
 
 import chatbot.globals as gl
-from chatbot.start import start
+import chatbot.keyboards as keyboards
+import chatbot.media as media
 import chatbot.registration as reg
 
 
@@ -43,61 +41,34 @@ async def courses_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
         reply_markup=ReplyKeyboardRemove()
     )
 
-    keyboard = [[InlineKeyboardButton(button, callback_data=button)]
-                for button in gl.COURSES_MENU_BUTTONS]
-    keyboard.append([InlineKeyboardButton(gl.BACK_BUTTON_NAME, callback_data=gl.BACK_BUTTON_NAME)])
-    reply_markup = InlineKeyboardMarkup(keyboard)
-
     await update.message.reply_text(
         text=gl.TEXT_DATA["courses_menu"],
-        reply_markup=reply_markup,
+        reply_markup=keyboards.courses_menu(),
         parse_mode="HTML"
     )
     return gl.COURSES_MENU
 
 
-async def courses_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+async def show_course(update: Update, context: ContextTypes.DEFAULT_TYPE, key: str) -> int:
     """
-    Handle user selections from the course sub-menu.
+    Show the course or the gallery selected in the course sub-menu.
 
-    Depending on the user's selection, this function either displays detailed
-    information about a selected course or navigates back to the previous menu.
+    A course is a text in courses_info and can be registered for, a gallery such as
+    the reviews is a dict with its images.
 
     Args:
         update (Update): Incoming update object containing the user's callback query.
         context (ContextTypes.DEFAULT_TYPE): Context object to maintain data across user sessions.
+        key (str): Key of the selected course in courses_buttons and courses_info.
 
     Returns:
-        int: The next state in the conversation flow, such as showing course information or returning to the menu.
+        int: The state indicating that the bot is now showing course information.
     """
-    query = update.callback_query
-    await query.answer()
-
-    match query.data:
-        case gl.COURSES_MENU_BUTTONS.basic:
-            context.user_data["course"] = gl.COURSES_MENU_BUTTONS.basic
-            return await handle_courses_option(update, context, text=gl.TEXT_DATA["courses_info"]["basic"])
-        case gl.COURSES_MENU_BUTTONS.individual:
-            context.user_data["course"] = gl.COURSES_MENU_BUTTONS.individual
-            return await handle_courses_option(update, context, text=gl.TEXT_DATA["courses_info"]["individual"])
-        case gl.COURSES_MENU_BUTTONS.professional:
-            context.user_data["course"] = gl.COURSES_MENU_BUTTONS.professional
-            return await handle_courses_option(update, context, text=gl.TEXT_DATA["courses_info"]["professional"])
-        case gl.COURSES_MENU_BUTTONS.cryptocurrency_training:
-            context.user_data["course"] = gl.COURSES_MENU_BUTTONS.cryptocurrency_training
-            return await handle_courses_option(update, context, text=gl.TEXT_DATA["courses_info"]["cryptocurrency_training"])
-        case gl.COURSES_MENU_BUTTONS.stock_market_training:
-            context.user_data["course"] = gl.COURSES_MENU_BUTTONS.stock_market_training
-            return await handle_courses_option(update, context, text=gl.TEXT_DATA["courses_info"]["stock_market_training"])
-        case gl.COURSES_MENU_BUTTONS.investor:
-            context.user_data["course"] = gl.COURSES_MENU_BUTTONS.stock_market_training
-            return await handle_courses_option(update, context, text=gl.TEXT_DATA["courses_info"]["investor"])
-        case gl.COURSES_MENU_BUTTONS.reviews:
-            return await course_pure_data_handler(update, context, text_data=gl.TEXT_DATA["courses_info"]["reviews"])
-        case gl.COURSES_MENU_BUTTONS.result:
-            return await course_pure_data_handler(update, context, text_data=gl.TEXT_DATA["courses_info"]["result"])
-        case gl.BACK_BUTTON_NAME:
-            return await start(query, context)
+    content = gl.TEXT_DATA["courses_info"][key]
+    if isinstance(content, str):
+        context.user_data["course"] = gl.TEXT_DATA["courses_buttons"][key]
+        return await handle_courses_option(update, context, text=content)
+    return await course_pure_data_handler(update, context, text_data=content)
 
 
 async def handle_courses_option(update: Update, context: ContextTypes.DEFAULT_TYPE, text) -> int:
@@ -116,15 +87,9 @@ async def handle_courses_option(update: Update, context: ContextTypes.DEFAULT_TY
     Returns:
         int: The state indicating that the bot is now showing course information.
     """
-    keyboard = [
-        [InlineKeyboardButton(gl.REGISTRATION_NAMES.registration, callback_data=gl.REGISTRATION_CALLBACK)],
-        [InlineKeyboardButton(gl.BACK_BUTTON_NAME, callback_data=gl.BACK_BUTTON_NAME)]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-
     await update.callback_query.message.reply_text(
         text=text,
-        reply_markup=reply_markup,
+        reply_markup=keyboards.REGISTRATION_OR_BACK,
         parse_mode="HTML"
     )
     return gl.COURSE_INFO_MENU
@@ -162,16 +127,11 @@ async def course_pure_data_handler(update: Update, context: ContextTypes.DEFAULT
     )
 
     chat_id = update.effective_chat.id
-    image = text_data["image_path"]
-    media_group = [InputMediaPhoto(open(image_path, 'rb')) for image_path in gl.get_all_file_paths(image)]
-    await context.bot.send_media_group(chat_id=chat_id, media=media_group)
-
-    keyboard = [[InlineKeyboardButton(gl.BACK_BUTTON_NAME, callback_data=gl.BACK_BUTTON_NAME)]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    await media.send_gallery(context.bot, chat_id, text_data["image_path"])
 
     await update.callback_query.message.reply_text(
         text=text_data["end_text"],
-        reply_markup=reply_markup,
+        reply_markup=keyboards.BACK,
         parse_mode="HTML"
     )
 
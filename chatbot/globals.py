@@ -1,11 +1,12 @@
 import os
-import json
 
 import pytz
 
 from collections import namedtuple
 from dotenv import load_dotenv
 
+from chatbot.texts import TextCatalog
+
 __version__ = "1.1"
 # Load environment variables from the .env file
 load_dotenv()
@@ -13,6 +14,23 @@ load_dotenv()
 TOKEN = os.getenv("TOKEN")
 ADMIN_CHAT_ID = os.getenv("ADMIN_CHAT_ID")
 DB_FILE = "dynamic/bots_info.db"
+
+# Update delivery: "webhook" needs WEBHOOK_URL, otherwise the bot falls back to long polling
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # Public HTTPS address of the server, without the path
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8081"))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")  # Checked against the header Telegram sends with every update
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+HEALTH_PATH = os.getenv("HEALTH_PATH", "/health")  # Empty string disables the health endpoint
+# Updates of different chats are processed concurrently, updates of one chat stay in order
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", "16"))
+MAX_PENDING_UPDATES = int(os.getenv("MAX_PENDING_UPDATES", "1024"))
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")  # Bot API server, e.g. a local fake one for tests
+# Seconds the running handlers and broadcasts get to finish after SIGTERM
+SHUTDOWN_TIMEOUT = float(os.getenv("SHUTDOWN_TIMEOUT", "20"))
+REPLACE_PID = int(os.getenv("REPLACE_PID", "0"))  # Running instance this process takes over from
+PID_FILE = "dynamic/bot.pid"  # Pid of the running instance, read by restart_script.sh
 SEPERATOR = "|"
 
 # Define states
@@ -22,26 +40,13 @@ START_MENU, COURSES_MENU, COURSE_INFO_MENU, \
     FINISH_REGISTRATION, SET_WEBINAR, SET_WEBINAR_URL, WAITING_FOR_MESSAGE,\
     REVIEW_SCHEDULE, WAITING_FOR_TIME, AWARDS_MENU, AFFILIATE_PROGRAM_INFO_MENU = range(19)
 
-# Define buttons names
+# Define buttons names, the course and project buttons are in texts.json
 Start_buttons = namedtuple("Start_buttuns", ["courses", "projects", "webinars", "registration", "awards",
                                              "affiliate_program", "cancel"])
 START_KEYBOARD_BUTTONS = Start_buttons("Навчання", "Проекти", "Вебінари", "Запис на консультацію",
                                        "Нагороди", "Партнерська програма", "Завершити розмову")
 SEND_ALL_BUTTON = "Відправити всім"
 
-Courses_buttons = namedtuple("Courses_buttuns", ["basic", "individual",
-                                                 "professional", "cryptocurrency_training",
-                                                 "stock_market_training", "investor",
-                                                 "reviews", "result"]
-                             )
-COURSES_MENU_BUTTONS = Courses_buttons("Базовий", "Індивідуальний VIP-курс",
-                                       "Профі-курс", "Крипто-курс",
-                                       "Фондовий ринок", "Курс інвестора", "Відгуки",
-                                       "Результати")
-
-Project_buttons = namedtuple("Project_buttons", ["portfolio", "bots_trading", "spiceprop"])
-PROJECT_MENU_BUTTONS = Project_buttons("Інвестиційний портфель", "Торгові Роботи", "Spiceprop")
-
 Registration_names = namedtuple("Registration_names", ["registration", "cancel", "registration_webinar"])
 REGISTRATION_NAMES = Registration_names("Записатись на консультацію", "Скасувати запис на консультацію",
                                         "Записатись на вебінар")
@@ -65,22 +70,45 @@ HOURS_REMIND = 1
 SET_WEBINAR_BUTTON = "Вказати дату вебінару"
 TIMEZONE = pytz.timezone("Europe/Kyiv")  # Replace with your timezone
 
-# Static texts.
+# Gallery images are converted to JPEG files of at most this size before the upload
+IMAGE_CACHE_DIR = "dynamic/media_cache"
+IMAGE_MAX_SIDE = 2560  # Pixels, the largest size Telegram keeps for a photo
+IMAGE_QUALITY = 85
+GALLERY_REFRESH_INTERVAL = 10  # Seconds between two checks of the gallery folders
+MEDIA_POOL_BYTES = 32 * 1024 * 1024  # Uploaded file contents kept in memory
+
+# Broadcast config
+BROADCAST_RATE = 25  # Messages per second for the whole bot, Telegram allows about 30
+BROADCAST_CHAT_RATE = 1  # Messages per second to a single chat
+BROADCAST_CHAT_BURST = 3  # Messages a single chat may get in a row before the chat rate applies
+BROADCAST_CONCURRENCY = 30  # Recipients served at the same time
+BROADCAST_MAX_ATTEMPTS = 5
+
+# Reminders and broadcasts are stored in the jobs table and loaded shortly before they run
+JOBS_POLL_INTERVAL = 60  # Seconds between two loads of the due jobs
+JOBS_MISFIRE_GRACE = 15 * 60  # Seconds a job missed while the bot was stopped may be late and still run
+JOBS_PAGE_SIZE = 500
+# Started webinars with their registrations and finished jobs are deleted after this many seconds
+HISTORY_MAX_AGE = 7 * 24 * 60 * 60
+HISTORY_PRUNE_INTERVAL = 6 * 60 * 60  # Seconds between two deletions
+
+# Every message sent by a broadcast or a reminder is recorded in the deliveries table
+DELIVERIES_FLUSH_ROWS = 500  # Pending deliveries that trigger a write right away
+DELIVERIES_MAX_AGE = 30 * 24 * 60 * 60  # Seconds the deliveries are kept
+
+# New users are written to the database in batches
+USERS_FLUSH_INTERVAL = 0.5  # Seconds between two writes
+USERS_FLUSH_ROWS = 100  # Pending users that trigger a write right away
+
+# Conversation states and user data survive restarts
+PERSISTENCE_UPDATE_INTERVAL = 5  # Seconds between two writes of the changed data
+PERSISTENCE_MAX_AGE = 7 * 24 * 60 * 60  # Seconds after which an abandoned conversation is dropped
+
+# Seconds between event loop lag reports in the log, 0 disables the measurement
+LOOP_LAG_REPORT_INTERVAL = int(os.getenv("LOOP_LAG_REPORT_INTERVAL", "0"))
+
+# Static texts, reloaded without a restart when the file changes
 PATH_TO_JSON_FILE = "static/texts.json"
-with open(PATH_TO_JSON_FILE, "r") as text:
-    TEXT_DATA = json.load(text)
-
-
-def get_all_file_paths(folder_path):
-    # List to store paths of all files
-    file_paths = []
-
-    # Iterate over all items in the folder
-    for item in os.listdir(folder_path):
-        # Construct full path
-        full_path = os.path.join(folder_path, item)
-        # Check if it is a file
-        if os.path.isfile(full_path):
-            file_paths.append(full_path)
+TEXTS_RELOAD_INTERVAL = 2  # Seconds between two checks of the file
+TEXT_DATA = TextCatalog(PATH_TO_JSON_FILE)
 
-    return file_paths
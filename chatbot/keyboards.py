@@ -0,0 +1,87 @@
+"""
+This script is a part of a Telegram bot that holds the keyboards of all menus.
+Every keyboard is built once instead of on every update: the static ones at import,
+the course and project menus from texts.json once per loaded version of the texts,
+the webinar menu once per list of upcoming webinars. Keyboard markups are immutable,
+so the handlers can share them safely. The main menu has a separate variant for the admin.
+"""
+import functools
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, KeyboardButton, ReplyKeyboardMarkup
+
+import chatbot.globals as gl
+
+
+def _inline_button(text, callback_data=None):
+    return InlineKeyboardButton(text, callback_data=text if callback_data is None else callback_data)
+
+
+def _inline_column(*buttons):
+    """Inline keyboard with one button per row."""
+    return InlineKeyboardMarkup([[button] for button in buttons])
+
+
+BACK_BUTTON = _inline_button(gl.BACK_BUTTON_NAME)
+
+START_USER = ReplyKeyboardMarkup([[button] for button in gl.START_KEYBOARD_BUTTONS],
+                                 one_time_keyboard=True, resize_keyboard=True)
+START_ADMIN = ReplyKeyboardMarkup([[button] for button in gl.START_KEYBOARD_BUTTONS]
+                                  + [[gl.SET_WEBINAR_BUTTON], [gl.SEND_ALL_BUTTON]],
+                                  one_time_keyboard=True, resize_keyboard=True)
+
+BACK = _inline_column(BACK_BUTTON)
+REGISTRATION_OR_BACK = _inline_column(_inline_button(gl.REGISTRATION_NAMES.registration, gl.REGISTRATION_CALLBACK),
+                                      BACK_BUTTON)
+
+CANCEL_REGISTRATION = _inline_column(_inline_button(gl.REGISTRATION_NAMES.cancel, gl.CANCEL_REGISTRATION_CALLBACK))
+SHARE_PHONE = ReplyKeyboardMarkup([[KeyboardButton(gl.PHONE_BUTTON_NAME, request_contact=True),
+                                    KeyboardButton(gl.REGISTRATION_NAMES.cancel)]],
+                                  one_time_keyboard=True, resize_keyboard=True)
+YES_NO = _inline_column(_inline_button(gl.YES_BUTTON_NAME), _inline_button(gl.NO_BUTTON_NAME))
+
+STOP_COLLECTING = _inline_column(_inline_button(gl.STOP_BUTTON, "stop"))
+REVIEW_SCHEDULE = _inline_column(_inline_button(gl.CONFIRM_SET_TIME_BUTTON, "confirm"),
+                                 _inline_button(gl.START_OVER_BUTTON, "start_over"))
+
+
+def _menu_from_texts(buttons_key):
+    """Inline menu with a button per entry of the texts section, the callback data is the entry key."""
+    return gl.TEXT_DATA.cached(lambda texts: _inline_column(
+        *(_inline_button(label, key) for key, label in texts[buttons_key].items()), BACK_BUTTON))
+
+
+courses_menu = _menu_from_texts("courses_buttons")
+projects_menu = _menu_from_texts("project_buttons")
+
+
+@functools.lru_cache(maxsize=32)
+def _webinar_registration(webinars: tuple) -> InlineKeyboardMarkup:
+    return _inline_column(*(_inline_button(f"{gl.REGISTRATION_NAMES.registration_webinar} {date_text}",
+                                           f"{gl.REGISTRATION_CALLBACK}:{webinar_id}")
+                            for webinar_id, date_text in webinars), BACK_BUTTON)
+
+
+def webinars_menu(webinars: list) -> InlineKeyboardMarkup:
+    """
+    Return the webinar menu with a registration button for every webinar.
+
+    Args:
+        webinars (list): Webinars open for registration.
+
+    Returns:
+        InlineKeyboardMarkup: The registration buttons and the back button.
+    """
+    return _webinar_registration(tuple((webinar.id, webinar.date_text) for webinar in webinars))
+
+
+def start_menu(chat_id: int) -> ReplyKeyboardMarkup:
+    """
+    Return the main menu keyboard for the chat.
+
+    Args:
+        chat_id (int): Chat the menu is sent to.
+
+    Returns:
+        ReplyKeyboardMarkup: The admin variant for the admin chat, the user variant otherwise.
+    """
+    return START_ADMIN if chat_id == int(gl.ADMIN_CHAT_ID) else START_USER
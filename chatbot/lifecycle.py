@@ -0,0 +1,259 @@
+"""
+This script is a part of a Telegram bot that runs the application from startup to a
+graceful shutdown. On SIGTERM or SIGINT the bot stops receiving updates, lets the
+running handlers and broadcasts finish within SHUTDOWN_TIMEOUT seconds, cancels and
+awaits whatever is still running, and then writes the persistence data and the
+pending users before it exits.
+
+The running process keeps its pid in PID_FILE. A new process can replace a running one
+with little delay: started with REPLACE_PID,
+it loads its code and builds the application first, then asks the old process to shut
+down. Work that changes shared state, like the database migrations, runs only after the
+old process has exited, and the new process starts handling updates right after it.
+In webhook mode the new process already accepts updates during the handover and
+queues them.
+"""
+import asyncio
+import functools
+import logging
+import os
+import signal
+import time
+
+from telegram import Update
+from telegram.ext import Application
+
+import chatbot.globals as gl
+
+logger = logging.getLogger(__name__)
+
+KILL_GRACE = 5  # Seconds a killed process gets to disappear before the takeover is given up
+
+# Set when the shutdown starts; long running jobs stop at the next point they can resume from
+stopping = asyncio.Event()
+# Tasks of the running job callbacks. PTB shields jobs from cancellation, so at the
+# shutdown deadline drain cancels the callbacks wrapped with cancellable through this set.
+_job_tasks = set()
+
+
+def cancellable(callback):
+    """
+    Let drain cancel the job callback when it is still running at the shutdown deadline.
+
+    Args:
+        callback (Callable): JobQueue callback.
+
+    Returns:
+        Callable: The callback, to be passed to the JobQueue instead of the original.
+    """
+    @functools.wraps(callback)
+    async def wrapper(context):
+        task = asyncio.current_task()
+        _job_tasks.add(task)
+        try:
+            return await callback(context)
+        finally:
+            _job_tasks.discard(task)
+    return wrapper
+
+
+class PollingReceiver:
+    """
+    Receives the updates through long polling.
+
+    Args:
+        application (Application): The bot application the updates are passed to.
+    """
+
+    def __init__(self, application: Application):
+        self.application = application
+
+    async def listen(self) -> None:
+        """Nothing to prepare, Telegram keeps the updates until they are fetched."""
+
+    async def start(self) -> None:
+        await self.application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+
+    async def stop(self) -> None:
+        if self.application.updater.running:
+            await self.application.updater.stop()
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    try:
+        # An exited child that was not reaped yet still has a pid
+        with open(f"/proc/{pid}/stat") as stat:
+            return stat.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except OSError:
+        return True
+
+
+def _is_bot_process(pid: int) -> bool:
+    # PID 1 of a container ignores SIGTERM and SIGKILL, and a stale pid may belong to anything
+    if pid <= 1 or pid == os.getpid():
+        return False
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as cmdline:
+            args = cmdline.read().decode(errors="replace").split("\0")
+    except FileNotFoundError:
+        return not os.path.isdir("/proc")
+    except OSError:
+        return False
+    return any(arg.endswith(os.path.join("chatbot", "main.py")) for arg in args)
+
+
+def write_pid_file() -> None:
+    """Store the pid of this process in PID_FILE, replacing the pid of the process it took over from."""
+    temporary = f"{gl.PID_FILE}.tmp"
+    try:
+        with open(temporary, "w") as pid_file:
+            pid_file.write(str(os.getpid()))
+        os.replace(temporary, gl.PID_FILE)
+    except OSError as error:
+        logger.warning("Failed to write the pid file, restart_script.sh will not find this process: %s", error)
+
+
+def remove_pid_file() -> None:
+    """Remove PID_FILE unless a newer process has already written its own pid to it."""
+    try:
+        with open(gl.PID_FILE) as pid_file:
+            if pid_file.read().strip() == str(os.getpid()):
+                os.remove(gl.PID_FILE)
+    except (OSError, ValueError):
+        pass
+
+
+async def take_over(pid: int) -> None:
+    """
+    Ask the process with the given pid to shut down and wait until it has exited.
+
+    Nothing is done if the pid does not belong to a bot process. The process is killed
+    if it is still running long after its shutdown deadline.
+
+    Args:
+        pid (int): Process id of the running bot instance.
+
+    Raises:
+        SystemExit: If the process cannot be signalled or survives being killed, so this
+            process does not share the webhook port with it.
+    """
+    if not _is_bot_process(pid):
+        logger.warning("Process %s is not a running bot, nothing to take over", pid)
+        return
+
+    logger.info("Taking over from process %s", pid)
+    try:
+        os.kill(pid, signal.SIGTERM)
+    except ProcessLookupError:
+        return
+    except PermissionError:
+        logger.error("Not allowed to stop process %s, exiting", pid)
+        raise SystemExit(1)
+
+    deadline = time.monotonic() + gl.SHUTDOWN_TIMEOUT + 10
+    killed = False
+    while _process_alive(pid):
+        if time.monotonic() > deadline:
+            if killed:
+                logger.error("Process %s survived SIGKILL, exiting", pid)
+                raise SystemExit(1)
+            logger.warning("Process %s did not exit in time, killing it", pid)
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            killed = True
+            deadline = time.monotonic() + KILL_GRACE
+        await asyncio.sleep(0.05)
+    logger.info("Process %s has exited", pid)
+
+
+def _outstanding_work(application: Application) -> set:
+    # Application.stop waits for the running jobs and the tasks of create_task, which
+    # include the updates being processed. PTB keeps the task set private, the name is
+    # the one of the pinned version.
+    tasks = set(getattr(application, "_Application__create_task_tasks", ()))
+    tasks.update(_job_tasks)
+    return {task for task in tasks if not task.done()}
+
+
+async def drain(application: Application) -> None:
+    """
+    Stop the application, waiting at most SHUTDOWN_TIMEOUT seconds for the running work.
+
+    Application.stop waits for the pending updates, the running jobs and the tasks
+    started with create_task. Whatever is still running at the deadline is cancelled,
+    jobs only if their callback is wrapped with cancellable, and Application.stop
+    finishes once the cancelled work has ended, so the bot and the database are closed
+    only after nothing uses them anymore.
+
+    Args:
+        application (Application): The running bot application.
+    """
+    stop_task = asyncio.create_task(application.stop())
+    done, _ = await asyncio.wait({stop_task}, timeout=gl.SHUTDOWN_TIMEOUT)
+    if not done:
+        logger.warning("Shutdown deadline of %s s reached, cancelling the remaining work", gl.SHUTDOWN_TIMEOUT)
+        while not stop_task.done():
+            # Cancelled work may start new tasks while it cleans up, those are cancelled too
+            for task in _outstanding_work(application):
+                task.cancel()
+            await asyncio.wait({stop_task}, timeout=0.1)
+    await stop_task
+
+
+async def run(application: Application, receiver, prepare=None) -> None:
+    """
+    Run the application until SIGINT or SIGTERM and shut it down gracefully.
+
+    Follows the same lifecycle as Application.run_polling, including the post_init,
+    post_stop and post_shutdown callbacks.
+
+    Args:
+        application (Application): The bot application.
+        receiver: PollingReceiver or WebhookReceiver that delivers the updates.
+        prepare (Callable): Blocking startup work that must not run while the replaced
+            process is still running, called in a worker thread before the application
+            is initialized.
+    """
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signal_number, stop_event.set)
+
+    await receiver.listen()
+    try:
+        if gl.REPLACE_PID:
+            await take_over(gl.REPLACE_PID)
+        if prepare:
+            await asyncio.to_thread(prepare)
+        await application.initialize()
+        try:
+            if application.post_init:
+                await application.post_init(application)
+            await application.start()
+            await receiver.start()
+            write_pid_file()
+            logger.info("Bot is running")
+
+            await stop_event.wait()
+        finally:
+            logger.info("Shutting down")
+            stopping.set()
+            await receiver.stop()
+            if application.running:
+                await drain(application)
+                if application.post_stop:
+                    await application.post_stop(application)
+            await application.shutdown()
+            if application.post_shutdown:
+                await application.post_shutdown(application)
+    finally:
+        await receiver.stop()
+        remove_pid_file()
@@ -6,30 +6,34 @@ It handles user interactions through a series of menus, allowing users to regist
 consultations, view courses, webinars, and projects. The bot uses an asynchronous
 architecture to handle multiple conversations and state transitions.
 """
+import asyncio
 import logging
-
-from telegram import Update
+import time
 
 from telegram.ext import (
     ApplicationBuilder,
-    ContextTypes,
     CommandHandler,
-    CallbackQueryHandler,
-    MessageHandler,
-    filters,
     ConversationHandler,
+    filters,
 )
 
 import chatbot.globals as gl
-import chatbot.courses as courses
-import chatbot.registration as reg
-import chatbot.webinars as webinars
-import chatbot.projects as projects
-import chatbot.send_all as send_all
-import chatbot.awards
-import chatbot.affiliate_program
-from chatbot.start import start, stop, restore_all_jobs, restore_all_webinars
+import chatbot.lifecycle as lifecycle
+import chatbot.media as media
+import chatbot.routing as routing
+import chatbot.webhook as webhook
+from chatbot.broadcast import broadcast_job
+from chatbot.start import start, stop, webinar_reminder
+from chatbot.stats import stats
+from chatbot.monitoring import LoopLagMonitor
+from chatbot.update_processor import PerChatUpdateProcessor
+import db.async_database as adb
+from db.connection import close_all
 from db.database import create_db_and_tables
+from db.delivery_ledger import delivery_ledger
+from db.job_store import delete_finished_jobs, job_store, BROADCAST, REMINDER
+from db.persistence import SQLitePersistence
+from db.user_buffer import user_buffer
 
 
 logging.basicConfig(
@@ -37,47 +41,81 @@ logging.basicConfig(
 )
 
 
-async def start_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+async def restore_jobs(application) -> None:
+    """Load the due jobs from the job store in the background."""
+    await job_store.start(application.job_queue)
+
+
+async def prune_history(context=None) -> None:
+    """
+    Delete the webinars that started and the jobs that finished more than HISTORY_MAX_AGE ago.
+
+    Can be used directly as a JobQueue callback.
     """
-    Handle the selection of an option in the main menu.
+    before = int(time.time()) - gl.HISTORY_MAX_AGE
+    webinars = await adb.delete_past_webinars(before)
+    jobs = await adb.run(delete_finished_jobs, before)
+    logging.info("Deleted %s past webinars and %s finished jobs", webinars, jobs)
+
+
+# The event loop lag measurement runs forever. It is not started with application.create_task,
+# since Application.stop waits for those tasks, but cancelled in post_stop.
+_loop_lag_task = None
+
+
+async def post_init(application) -> None:
+    """Start the background startup tasks and the event loop lag measurement if it is enabled."""
+    global _loop_lag_task
+    application.create_task(restore_jobs(application))
+    if gl.LOOP_LAG_REPORT_INTERVAL:
+        _loop_lag_task = asyncio.create_task(LoopLagMonitor().run(gl.LOOP_LAG_REPORT_INTERVAL))
+
+
+async def post_stop(application) -> None:
+    """Stop the event loop lag measurement."""
+    if _loop_lag_task is not None:
+        _loop_lag_task.cancel()
+        await asyncio.gather(_loop_lag_task, return_exceptions=True)
 
-    Depending on the user's selection, navigate to the corresponding menu or action:
-    - Courses menu
-    - Registration for consultation
-    - Webinars menu
-    - Projects menu
-    - Cancel the current operation
-    - Set the webinar date
-    - Send message to all users
+
+async def post_shutdown(application) -> None:
+    """Write the pending users and deliveries, stop the database thread and close the connections."""
+    await user_buffer.flush()
+    await delivery_ledger.flush()
+    adb.shutdown()
+    close_all()
+
+
+def make_receiver(application):
+    """
+    Choose how the updates are received.
+
+    The webhook is used only with both WEBHOOK_URL and WEBHOOK_SECRET, since without
+    the secret anyone could post forged updates to the public endpoint.
 
     Args:
-        update (Update): Incoming update object containing message and user data.
-        context (ContextTypes.DEFAULT_TYPE): Context object to maintain data across user sessions.
+        application (Application): The bot application the updates are passed to.
 
     Returns:
-        int: The next state in the conversation flow.
+        WebhookReceiver | PollingReceiver: The update receiver.
+    """
+    if gl.BOT_MODE == "webhook":
+        if gl.WEBHOOK_URL and gl.WEBHOOK_SECRET:
+            return webhook.WebhookReceiver(application)
+        logging.warning("WEBHOOK_URL or WEBHOOK_SECRET is not set, falling back to polling")
+    return lifecycle.PollingReceiver(application)
+
+
+def prepare() -> None:
+    """
+    Migrate the database and finish its backfills, load the known users and build the gallery images.
+
+    Runs after a replaced process has exited, since it would otherwise work against a
+    migrated schema and a pruned image cache.
     """
-    user_option = update.message.text
-
-    match user_option:
-        case gl.START_KEYBOARD_BUTTONS.courses:
-            return await courses.courses_menu(update, context)
-        case gl.START_KEYBOARD_BUTTONS.registration:
-            return await reg.register(update, context, gl.REGISTRATION_FOR_CONSULTATION)
-        case gl.START_KEYBOARD_BUTTONS.webinars:
-            return await webinars.webinars_menu(update, context)
-        case gl.START_KEYBOARD_BUTTONS.projects:
-            return await projects.projects_menu(update, context)
-        case gl.START_KEYBOARD_BUTTONS.cancel:
-            return await stop(update, context)
-        case gl.START_KEYBOARD_BUTTONS.awards:
-            return await chatbot.awards.awards_info(update, context)
-        case gl.START_KEYBOARD_BUTTONS.affiliate_program:
-            return await chatbot.affiliate_program.affiliate_program_info(update, context)
-        case gl.SET_WEBINAR_BUTTON:
-            return await webinars.set_webinar_date(update, context)
-        case gl.SEND_ALL_BUTTON:
-            return await send_all.get_data_from_admin(update, context)
+    create_db_and_tables()
+    user_buffer.load()
+    media.build_derivatives(media.image_folders(gl.TEXT_DATA.snapshot))
 
 
 def main() -> None:
@@ -85,56 +123,41 @@ def main() -> None:
     Set up and start the Telegram bot application.
 
     This function creates an application instance, sets up conversation handlers
-    with different states for handling user interactions, and starts the bot's
-    polling mechanism to listen for incoming updates and commands.
+    with different states for handling user interactions, and starts listening
+    for incoming updates through the webhook server or, as a fallback, polling.
     """
-    create_db_and_tables()
-    application = ApplicationBuilder().token(gl.TOKEN).build()
-    restore_all_jobs(application)
-    restore_all_webinars(application)
+    update_processor = PerChatUpdateProcessor(gl.MAX_CONCURRENT_UPDATES, gl.MAX_PENDING_UPDATES)
+    builder = (ApplicationBuilder().token(gl.TOKEN)
+               .concurrent_updates(update_processor)
+               .persistence(SQLitePersistence()))
+    if gl.TELEGRAM_API_URL:
+        builder = builder.base_url(f"{gl.TELEGRAM_API_URL}/bot").base_file_url(f"{gl.TELEGRAM_API_URL}/file/bot")
+    application = builder.post_init(post_init).post_stop(post_stop).post_shutdown(post_shutdown).build()
+    job_store.register(REMINDER, webinar_reminder)
+    job_store.register(BROADCAST, broadcast_job)
+    application.job_queue.run_repeating(lifecycle.cancellable(user_buffer.flush), interval=gl.USERS_FLUSH_INTERVAL)
+    application.job_queue.run_repeating(lifecycle.cancellable(gl.TEXT_DATA.watch), interval=gl.TEXTS_RELOAD_INTERVAL)
+    application.job_queue.run_repeating(lifecycle.cancellable(media.refresh_galleries),
+                                        interval=gl.GALLERY_REFRESH_INTERVAL)
+    application.job_queue.run_repeating(lifecycle.cancellable(prune_history), interval=gl.HISTORY_PRUNE_INTERVAL,
+                                        first=60)  # Once the startup work is done
 
     conv_handler = ConversationHandler(
         entry_points=[CommandHandler('start', start)],
-        states={
-            gl.START_MENU: [MessageHandler(filters.TEXT & ~filters.COMMAND, start_handler)],
-            gl.COURSES_MENU: [CallbackQueryHandler(courses.courses_handler)],
-            gl.COURSE_INFO_MENU: [CallbackQueryHandler(courses.course_info_handler)],
-            gl.ASK_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, reg.registration_phone),
-                          CallbackQueryHandler(reg.registration_phone)],
-            gl.ASK_NUMBER: [MessageHandler(filters.CONTACT, reg.registration_city),
-                            MessageHandler(filters.TEXT & ~filters.COMMAND, reg.registration_city)],
-            gl.ASK_CITY: [MessageHandler(filters.TEXT, reg.registration_email),
-                          CallbackQueryHandler(reg.registration_email)],
-            gl.ASK_EMAIL: [MessageHandler(filters.TEXT & ~filters.COMMAND, reg.registration_confirmation),
-                           CallbackQueryHandler( reg.registration_confirmation)],
-            gl.CONFIRMATION: [CallbackQueryHandler(reg.registration_confirmation_handler)],
-            gl.WEBINAR_MENU: [CallbackQueryHandler(webinars.webinars_handler)],
-            gl.PROJECT_MENU: [CallbackQueryHandler(projects.project_handler)],
-            gl.PROJECT_INFO_MENU: [CallbackQueryHandler(projects.project_info_handler)],
-            gl.FINISH_REGISTRATION: [CallbackQueryHandler(reg.finish_registration_handler)],
-            gl.SET_WEBINAR: [MessageHandler(filters.TEXT & ~filters.COMMAND, webinars.registration_webinar),
-                             CallbackQueryHandler(webinars.registration_webinar)],
-            gl.SET_WEBINAR_URL: [MessageHandler(filters.TEXT & ~filters.COMMAND, webinars.registration_webinar_url),
-                                 CallbackQueryHandler(webinars.registration_webinar_url)],
-            gl.WAITING_FOR_MESSAGE: [
-                MessageHandler(filters.TEXT | filters.PHOTO | filters.ALL, send_all.receive_message),
-                CallbackQueryHandler(send_all.stop_collection, pattern="^stop$")],
-            gl.REVIEW_SCHEDULE: [CallbackQueryHandler(send_all.confirm_schedule, pattern="^confirm$"),
-                                 CallbackQueryHandler(send_all.restart_collection, pattern="^start_over$")],
-            gl.WAITING_FOR_TIME: [MessageHandler(filters.TEXT & ~filters.COMMAND, send_all.receive_time)],
-            gl.AWARDS_MENU: [CallbackQueryHandler(chatbot.awards.awards_handler)],
-            gl.AFFILIATE_PROGRAM_INFO_MENU: [CallbackQueryHandler(chatbot.affiliate_program.affiliate_program_info_handler)],
-
-        },
+        states=routing.conversation_states(),
         fallbacks=[CommandHandler('cancel', stop)],
+        name="main",
+        persistent=True,
     )
 
+    # Registered before the conversation, so the admin can use it in any state
+    application.add_handler(CommandHandler('stats', stats, filters=filters.Chat(int(gl.ADMIN_CHAT_ID))))
     application.add_handler(conv_handler)
 
     # Handle the case when a user sends /start but they're not in a conversation
     application.add_handler(CommandHandler('start', start))
 
-    application.run_polling()
+    asyncio.run(lifecycle.run(application, make_receiver(application), prepare=prepare))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,393 @@
+"""
+This script is a part of a Telegram bot that sends the static image galleries
+(awards, results, reviews and projects). Every file under the static folder is
+uploaded to Telegram only once: the file_id Telegram returns for it is stored in
+the database together with the hash of the file content, and afterwards the
+gallery is sent by file_id. If Telegram rejects a stored file_id, the gallery is
+uploaded again and the stored ids are refreshed.
+
+Telegram recompresses every photo anyway, so the images are not uploaded as they are:
+a build step at startup turns every gallery image into a JPEG no larger than
+IMAGE_MAX_SIDE pixels, stored in IMAGE_CACHE_DIR under a name derived from the content
+of the image and the build settings. Only new or changed images are converted, and
+uploads use these derivatives. Without Pillow the original images are uploaded.
+
+The file lists of the galleries are kept in an index, sorted by name, so sending a
+gallery needs no filesystem access. A job checks the modification time of the gallery
+folders and of their files, and rescans only the folders that changed, so an image
+overwritten in place is uploaded again too.
+
+The bytes of the uploaded files are read once and kept in a pool shared by all
+requests, so concurrent uploads of a gallery use one read-only copy and open no files.
+Hashing and reading files happens in a worker thread, the event loop only sends
+galleries whose hashes and file_ids are already known.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict, namedtuple
+from collections.abc import Mapping
+
+from telegram import Bot, InputMediaPhoto
+from telegram.error import BadRequest
+
+import chatbot.globals as gl
+import db.async_database as adb
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# path -> (content_hash, file_id), loaded from the database on first use
+_file_ids = None
+# path -> (mtime_ns, size, content_hash), so unchanged files are not hashed again
+_hashes = {}
+# image path -> path of the converted image that is uploaded instead
+_derivatives = {}
+
+GalleryFile = namedtuple("GalleryFile", ["path", "size", "mtime_ns"])
+
+
+def _natural_key(name: str) -> list:
+    # "10.png" comes after "9.png"
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", name)]
+
+
+class GalleryIndex:
+    """Sorted file lists of the gallery folders, rescanned only when a folder or one of its files changes."""
+
+    def __init__(self):
+        # folder -> (modification time of the folder, tuple of GalleryFile)
+        self.folders = {}
+
+    @staticmethod
+    def _scan(folder: str) -> tuple:
+        try:
+            # Taken before the scan, so a change during the scan is picked up by the next refresh
+            mtime_ns = os.stat(folder).st_mtime_ns
+            entries = [entry for entry in os.scandir(folder) if entry.is_file()]
+        except OSError as error:
+            logger.error("Failed to read the gallery %s: %s", folder, error)
+            return None, ()
+        entries.sort(key=lambda entry: _natural_key(entry.name))
+        files = []
+        for entry in entries:
+            stat = entry.stat()
+            files.append(GalleryFile(os.path.join(folder, entry.name), stat.st_size, stat.st_mtime_ns))
+        return mtime_ns, tuple(files)
+
+    @staticmethod
+    def _files_changed(files: tuple) -> bool:
+        # Overwriting a file in place does not change the modification time of its folder
+        for file in files:
+            try:
+                stat = os.stat(file.path)
+            except OSError:
+                return True
+            if (stat.st_mtime_ns, stat.st_size) != (file.mtime_ns, file.size):
+                return True
+        return False
+
+    def files(self, folder: str) -> tuple:
+        """
+        Return the files of the gallery, scanning the folder if it is not indexed yet.
+
+        Args:
+            folder (str): Gallery folder.
+
+        Returns:
+            tuple: GalleryFile of every file in the folder, sorted by name.
+        """
+        if folder not in self.folders:
+            self.folders[folder] = self._scan(folder)
+        return self.folders[folder][1]
+
+    def refresh(self, folders: list) -> list:
+        """
+        Rescan the folders that changed and forget the ones that are no longer used.
+
+        Args:
+            folders (list): Gallery folders in use.
+
+        Returns:
+            list: Folders that were rescanned or forgotten.
+        """
+        changed = []
+        for folder in folders:
+            try:
+                mtime_ns = os.stat(folder).st_mtime_ns
+            except OSError:
+                mtime_ns = None
+            indexed = self.folders.get(folder)
+            if indexed is None or indexed[0] != mtime_ns or self._files_changed(indexed[1]):
+                self.folders[folder] = self._scan(folder)
+                changed.append(folder)
+        for folder in set(self.folders) - set(folders):
+            del self.folders[folder]
+            changed.append(folder)
+        return changed
+
+
+galleries = GalleryIndex()
+
+
+class BufferPool:
+    """
+    Read-only contents of the uploaded files, shared by all requests.
+
+    The least recently used buffers are dropped when the pool grows over max_bytes.
+
+    Args:
+        max_bytes (int): Maximum total size of the kept buffers.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        # path -> (version, bytes)
+        self.buffers = OrderedDict()
+        # Uploads are prepared in worker threads
+        self.lock = threading.Lock()
+
+    def get(self, path: str, version) -> bytes:
+        """
+        Return the content of the file, reading it only if this version is not pooled.
+
+        Args:
+            path (str): Path to the file.
+            version: Changes whenever the file content changes.
+
+        Returns:
+            bytes: The file content.
+        """
+        with self.lock:
+            entry = self.buffers.get(path)
+            if entry is not None and entry[0] == version:
+                self.buffers.move_to_end(path)
+                return entry[1]
+
+        with open(path, "rb") as file:
+            data = file.read()
+        with self.lock:
+            entry = self.buffers.pop(path, None)
+            if entry is not None:
+                self.size -= len(entry[1])
+            self.buffers[path] = (version, data)
+            self.size += len(data)
+            while self.size > self.max_bytes and len(self.buffers) > 1:
+                _, (_, dropped) = self.buffers.popitem(last=False)
+                self.size -= len(dropped)
+        return data
+
+
+buffers = BufferPool(gl.MEDIA_POOL_BYTES)
+
+
+def _known_hash(file: GalleryFile):
+    cached = _hashes.get(file.path)
+    if cached and cached[:2] == (file.mtime_ns, file.size):
+        return cached[2]
+    return None
+
+
+def content_hash(file: GalleryFile) -> str:
+    """
+    Return the sha256 hash of the file content.
+
+    The hash is recomputed only when the file modification time or size changes.
+
+    Args:
+        file (GalleryFile): The file with its size and modification time.
+
+    Returns:
+        str: Hex digest of the file content.
+    """
+    known = _known_hash(file)
+    if known:
+        return known
+
+    digest = hashlib.sha256()
+    with open(file.path, "rb") as data:
+        for chunk in iter(lambda: data.read(1024 * 1024), b""):
+            digest.update(chunk)
+    _hashes[file.path] = (file.mtime_ns, file.size, digest.hexdigest())
+    return digest.hexdigest()
+
+
+def image_folders(texts) -> list:
+    """
+    Return the gallery folders referenced by the image_path keys of the texts.
+
+    Args:
+        texts (Mapping): The texts, as loaded from texts.json.
+
+    Returns:
+        list: Folder paths, each listed once.
+    """
+    folders = []
+    for key, value in texts.items():
+        if isinstance(value, Mapping):
+            folders.extend(folder for folder in image_folders(value) if folder not in folders)
+        elif key.endswith("image_path") and value not in folders:
+            folders.append(value)
+    return folders
+
+
+def _derive(file: GalleryFile) -> str:
+    settings = f"{gl.IMAGE_MAX_SIDE}:{gl.IMAGE_QUALITY}"
+    name = hashlib.sha256(f"{content_hash(file)}:{settings}".encode()).hexdigest()[:32]
+    target = os.path.join(gl.IMAGE_CACHE_DIR, f"{name}.jpg")
+    if not os.path.exists(target):
+        with Image.open(file.path) as image:
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((gl.IMAGE_MAX_SIDE, gl.IMAGE_MAX_SIDE), Image.LANCZOS)
+            if image.mode in ("RGBA", "LA", "P"):
+                # JPEG has no transparency, put the image on a white background
+                image = image.convert("RGBA")
+                background = Image.new("RGB", image.size, "white")
+                background.paste(image, mask=image.getchannel("A"))
+                image = background
+            elif image.mode != "RGB":
+                image = image.convert("RGB")
+            temporary = f"{target}.tmp"
+            image.save(temporary, "JPEG", quality=gl.IMAGE_QUALITY, optimize=True, progressive=True)
+            os.replace(temporary, target)
+    return target
+
+
+def build_derivatives(folders: list) -> None:
+    """
+    Convert the images of the galleries into size-capped JPEG files.
+
+    Images whose derivative already exists are skipped, derivatives no gallery uses
+    anymore are deleted. A derivative that is not smaller than its image is kept, so it
+    is not converted again, but the image is uploaded instead.
+
+    Args:
+        folders (list): Gallery folders.
+    """
+    if Image is None:
+        logger.warning("Pillow is not installed, gallery images are uploaded unchanged")
+        return
+
+    global _derivatives
+    os.makedirs(gl.IMAGE_CACHE_DIR, exist_ok=True)
+    derivatives = {}
+    used = set()
+    for folder in folders:
+        for file in galleries.files(folder):
+            try:
+                target = _derive(file)
+            except OSError as error:
+                logger.error("Failed to convert %s, it is uploaded unchanged: %s", file.path, error)
+                continue
+            used.add(os.path.basename(target))
+            if os.path.getsize(target) < file.size:
+                derivatives[file.path] = target
+
+    # Swapped at once, the job rebuilds the derivatives in a worker thread.
+    # Uploads stop using the old derivatives before they are deleted.
+    _derivatives = derivatives
+    for name in os.listdir(gl.IMAGE_CACHE_DIR):
+        if name not in used:
+            os.remove(os.path.join(gl.IMAGE_CACHE_DIR, name))
+    logger.info("Gallery images ready, %s converted", len(derivatives))
+
+
+async def refresh_galleries(context=None) -> None:
+    """
+    Rescan the changed gallery folders and convert their new images.
+
+    Can be used directly as a JobQueue callback.
+    """
+    folders = image_folders(gl.TEXT_DATA.snapshot)
+    changed = galleries.refresh(folders)
+    if changed:
+        logger.info("Galleries changed: %s", ", ".join(changed))
+        await asyncio.to_thread(build_derivatives, folders)
+
+
+async def _get_file_ids() -> dict:
+    global _file_ids
+    if _file_ids is None:
+        _file_ids = {path: (file_hash, file_id) for path, file_hash, file_id in await adb.get_all_media_files()}
+    return _file_ids
+
+
+def _upload(file: GalleryFile) -> InputMediaPhoto:
+    derivative = _derivatives.get(file.path)
+    data = None
+    if derivative:
+        try:
+            # The name of a derivative changes with its content
+            data = buffers.get(derivative, derivative)
+        except FileNotFoundError:
+            # Deleted by a rebuild that replaced it
+            logger.warning("Derivative of %s is gone, uploading the image", file.path)
+    if data is None:
+        data = buffers.get(file.path, (file.mtime_ns, file.size))
+    # InputFile keeps bytes as they are, so every request shares the pooled buffer
+    return InputMediaPhoto(data, filename=os.path.basename(file.path))
+
+
+def _content_hashes(files: tuple) -> list:
+    return [content_hash(file) for file in files]
+
+
+def _media_group(files: tuple, cached: dict) -> list:
+    return [InputMediaPhoto(cached[file.path]) if file.path in cached else _upload(file) for file in files]
+
+
+async def send_gallery(bot: Bot, chat_id: int, folder: str) -> None:
+    """
+    Send all images from the folder as a single media group.
+
+    Images already known to Telegram are sent by file_id, the others are uploaded
+    and their file_id is remembered for the next time.
+
+    Args:
+        bot (Bot): Bot instance used to send the media group.
+        chat_id (int): Chat the gallery is sent to.
+        folder (str): Folder with the gallery images.
+    """
+    file_ids = await _get_file_ids()
+    files = galleries.files(folder)
+    paths = [file.path for file in files]
+    hashes = [_known_hash(file) for file in files]
+    if None in hashes:
+        # New or changed files are read, which would block the event loop
+        hashes = await asyncio.to_thread(_content_hashes, files)
+
+    cached = {path: file_ids[path][1] for path, file_hash in zip(paths, hashes)
+              if file_ids.get(path, (None,))[0] == file_hash}
+    if len(cached) == len(files):
+        media_group = _media_group(files, cached)
+    else:
+        media_group = await asyncio.to_thread(_media_group, files, cached)
+
+    try:
+        messages = await bot.send_media_group(chat_id=chat_id, media=media_group)
+    except BadRequest as error:
+        if not cached:
+            raise
+        # One of the stored file_ids is no longer valid, upload the whole gallery again
+        logger.warning("Stored file_ids for %s were rejected (%s), uploading again", folder, error)
+        await adb.delete_media_files(list(cached))
+        for path in cached:
+            file_ids.pop(path, None)
+        cached = {}
+        media_group = await asyncio.to_thread(_media_group, files, cached)
+        messages = await bot.send_media_group(chat_id=chat_id, media=media_group)
+
+    for path, file_hash, message in zip(paths, hashes, messages):
+        if path in cached or not message.photo:
+            continue
+        file_id = message.photo[-1].file_id
+        file_ids[path] = (file_hash, file_id)
+        await adb.set_media_file(path, file_hash, file_id)
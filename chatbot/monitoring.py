@@ -0,0 +1,61 @@
+"""
+This script is a part of a Telegram bot that measures how long the asyncio event loop
+is blocked. A background task wakes up every few milliseconds and records how much
+later than requested it was resumed; the delay is the time the loop spent running
+blocking code. The totals are logged periodically, so the same load can be compared
+before and after a change.
+"""
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class LoopLagMonitor:
+    """
+    Measure event loop blocking time.
+
+    Args:
+        tick (float): Seconds between two wake-ups of the monitor.
+        threshold (float): Delays shorter than this are not counted as blocking.
+    """
+
+    def __init__(self, tick: float = 0.01, threshold: float = 0.005):
+        self.tick = tick
+        self.threshold = threshold
+        self.reset()
+
+    def reset(self) -> None:
+        self.started = time.monotonic()
+        self.max_lag = 0.0
+        self.blocked = 0.0
+        self.stalls = 0
+
+    async def run(self, report_interval: float) -> None:
+        """
+        Record the loop lag forever and log a summary every report_interval seconds.
+
+        Args:
+            report_interval (float): Seconds between two log summaries.
+        """
+        next_report = time.monotonic() + report_interval
+        while True:
+            expected = time.monotonic() + self.tick
+            await asyncio.sleep(self.tick)
+            now = time.monotonic()
+            lag = now - expected
+            if lag > self.threshold:
+                self.blocked += lag
+                self.stalls += 1
+                self.max_lag = max(self.max_lag, lag)
+
+            if now >= next_report:
+                logger.info(self.summary())
+                self.reset()
+                next_report = now + report_interval
+
+    def summary(self) -> str:
+        elapsed = time.monotonic() - self.started
+        return (f"Event loop blocked {self.blocked * 1000:.0f} ms in {elapsed:.0f} s "
+                f"({self.stalls} stalls, max {self.max_lag * 1000:.0f} ms)")
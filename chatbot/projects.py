@@ -9,10 +9,7 @@ import os
 
 from telegram import (
     Update,
-    InlineKeyboardButton,
-    InlineKeyboardMarkup,
-    ReplyKeyboardRemove,
-    InputMediaPhoto
+    ReplyKeyboardRemove
 )
 
 from telegram.ext import (
@@ -20,7 +17,8 @@ from telegram.ext import (
 )
 
 import chatbot.globals as gl
-from chatbot.start import start
+import chatbot.keyboards as keyboards
+import chatbot.media as media
 import chatbot.registration as reg
 
 
@@ -45,52 +43,32 @@ async def projects_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
         reply_markup=ReplyKeyboardRemove()
     )
 
-    keyboard = [[InlineKeyboardButton(button, callback_data=button)]
-                for button in gl.PROJECT_MENU_BUTTONS]
-    keyboard.append([InlineKeyboardButton(gl.BACK_BUTTON_NAME, callback_data=gl.BACK_BUTTON_NAME)])
-    reply_markup = InlineKeyboardMarkup(keyboard)
-
     await update.message.reply_text(
         text=gl.TEXT_DATA["project_menu"],
-        reply_markup=reply_markup,
+        reply_markup=keyboards.projects_menu(),
         parse_mode="HTML"
     )
     return gl.PROJECT_MENU
 
 
-async def project_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+async def show_project(update: Update, context: ContextTypes.DEFAULT_TYPE, key: str) -> int:
     """
-    Handle user selections from the project sub-menu.
-
-    Depending on the user's selection, this function either displays detailed
-    information about a selected project or navigates back to the previous menu.
+    Show the project selected in the project sub-menu.
 
     Args:
         update (Update): Incoming update object containing the user's callback query.
         context (ContextTypes.DEFAULT_TYPE): Context object to maintain data across user sessions.
+        key (str): Key of the selected project in project_buttons and project_info.
 
     Returns:
-        int: The next state in the conversation flow, such as showing project information or returning to the menu.
+        int: The state indicating that the bot is now showing project information.
     """
-    query = update.callback_query
-    await query.answer()
-
-    match query.data:
-        case gl.PROJECT_MENU_BUTTONS.portfolio:
-            context.user_data["project"] = gl.PROJECT_MENU_BUTTONS.portfolio
-            return await handle_project_option(update, context, text=gl.TEXT_DATA["project_info"]["portfolio"]["text"],
-                                               image=gl.TEXT_DATA["project_info"]["portfolio"]["image_path"],
-                                               end_text=gl.TEXT_DATA["project_info"]["portfolio"]["end_text"])
-        case gl.PROJECT_MENU_BUTTONS.bots_trading:
-            context.user_data["project"] = gl.PROJECT_MENU_BUTTONS.bots_trading
-            return await handle_project_option(update, context, text=gl.TEXT_DATA["project_info"]["bots_trading"]["text"],
-                                               image=gl.TEXT_DATA["project_info"]["bots_trading"]["image_path"],
-                                               end_text=gl.TEXT_DATA["project_info"]["bots_trading"]["end_text"])
-        case gl.PROJECT_MENU_BUTTONS.spiceprop:
-            context.user_data["project"] = gl.PROJECT_MENU_BUTTONS.spiceprop
-            return await handle_project_option(update, context, text=gl.TEXT_DATA["project_info"]["spiceprop"])
-        case gl.BACK_BUTTON_NAME:
-            return await start(query, context)
+    context.user_data["project"] = gl.TEXT_DATA["project_buttons"][key]
+    content = gl.TEXT_DATA["project_info"][key]
+    if isinstance(content, str):
+        return await handle_project_option(update, context, text=content)
+    return await handle_project_option(update, context, text=content["text"], image=content["image_path"],
+                                       end_text=content["end_text"])
 
 
 async def handle_project_option(update: Update, context: ContextTypes.DEFAULT_TYPE, text,
@@ -113,32 +91,25 @@ async def handle_project_option(update: Update, context: ContextTypes.DEFAULT_TY
     Returns:
         int: The state indicating that the bot is now showing project information.
     """
-    keyboard = [
-        [InlineKeyboardButton(gl.REGISTRATION_NAMES.registration, callback_data=gl.REGISTRATION_CALLBACK)],
-        [InlineKeyboardButton(gl.BACK_BUTTON_NAME, callback_data=gl.BACK_BUTTON_NAME)]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-
     if image:
         chat_id = update.effective_chat.id
-        media_group = [InputMediaPhoto(open(image_path, 'rb')) for image_path in gl.get_all_file_paths(image)]
         await update.callback_query.message.reply_text(
             text=text,
             parse_mode="HTML"
         )
 
-        await context.bot.send_media_group(chat_id=chat_id, media=media_group)
+        await media.send_gallery(context.bot, chat_id, image)
 
         await update.callback_query.message.reply_text(
             text=end_text,
-            reply_markup=reply_markup,
+            reply_markup=keyboards.REGISTRATION_OR_BACK,
             parse_mode="HTML"
         )
         return gl.PROJECT_INFO_MENU
 
     await update.callback_query.message.reply_text(
         text=text,
-        reply_markup=reply_markup,
+        reply_markup=keyboards.REGISTRATION_OR_BACK,
         parse_mode="HTML"
     )
     return gl.PROJECT_INFO_MENU
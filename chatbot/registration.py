@@ -8,10 +8,6 @@ seamlessly.
 """
 from telegram import (
     Update,
-    KeyboardButton,
-    ReplyKeyboardMarkup,
-    InlineKeyboardButton,
-    InlineKeyboardMarkup,
     ReplyKeyboardRemove
 )
 
@@ -21,6 +17,7 @@ from telegram.ext import (
 )
 
 import chatbot.globals as gl
+import chatbot.keyboards as keyboards
 from chatbot.start import start, make_reminder
 
 
@@ -40,14 +37,9 @@ async def register(update: Update, context: ContextTypes.DEFAULT_TYPE, registrat
     Returns:
         int: The next state in the conversation flow, indicating that the bot is now asking for the user's name.
     """
-    keyboard = [
-        [InlineKeyboardButton(gl.REGISTRATION_NAMES.cancel, callback_data=gl.CANCEL_REGISTRATION_CALLBACK)]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-
     context.user_data["registration_for"] = registration_for
     await update.message.reply_text(gl.TEXT_DATA["registration_question"]["name"],
-                                    reply_markup=reply_markup,
+                                    reply_markup=keyboards.CANCEL_REGISTRATION,
                                     parse_mode="HTML")
     return gl.ASK_NAME
 
@@ -73,15 +65,8 @@ async def registration_phone(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return await finish_registration_menu(query, context)
 
     context.user_data['name'] = update.message.text
-    reply_markup = ReplyKeyboardMarkup([[
-        KeyboardButton(gl.PHONE_BUTTON_NAME, request_contact=True),
-        KeyboardButton(gl.REGISTRATION_NAMES.cancel)
-    ]],
-        one_time_keyboard=True,
-        resize_keyboard=True
-    )
     await update.message.reply_text(gl.TEXT_DATA["registration_question"]["phone"],
-                                    reply_markup=reply_markup,
+                                    reply_markup=keyboards.SHARE_PHONE,
                                     parse_mode="HTML")
     return gl.ASK_NUMBER
 
@@ -106,11 +91,8 @@ async def registration_city(update: Update, context: ContextTypes.DEFAULT_TYPE)
     context.user_data['phone_number'] = update.message.contact.phone_number
 
     await update.message.reply_text(gl.TEXT_DATA["registration_question"]["city_1"], reply_markup=ReplyKeyboardRemove())
-    keyboard = [
-        [InlineKeyboardButton(gl.REGISTRATION_NAMES.cancel, callback_data=gl.CANCEL_REGISTRATION_CALLBACK)]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await update.message.reply_text(gl.TEXT_DATA["registration_question"]["city_2"], reply_markup=reply_markup)
+    await update.message.reply_text(gl.TEXT_DATA["registration_question"]["city_2"],
+                                    reply_markup=keyboards.CANCEL_REGISTRATION)
     return gl.ASK_CITY
 
 
@@ -135,12 +117,8 @@ async def registration_email(update: Update, context: ContextTypes.DEFAULT_TYPE)
     context.user_data['city'] = update.message.text
 
     await update.message.reply_text(gl.TEXT_DATA["registration_question"]["email_1"], reply_markup=ReplyKeyboardRemove())
-    keyboard = [
-        [InlineKeyboardButton(gl.REGISTRATION_NAMES.cancel, callback_data=gl.CANCEL_REGISTRATION_CALLBACK)]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-
-    await update.message.reply_text(gl.TEXT_DATA["registration_question"]["email_2"], reply_markup=reply_markup)
+    await update.message.reply_text(gl.TEXT_DATA["registration_question"]["email_2"],
+                                    reply_markup=keyboards.CANCEL_REGISTRATION)
     return gl.ASK_EMAIL
 
 
@@ -170,15 +148,10 @@ async def registration_confirmation(update: Update, context: ContextTypes.DEFAUL
     city = context.user_data["city"]
     email = context.user_data["email"]
 
-    keyboard = [
-        [InlineKeyboardButton(gl.YES_BUTTON_NAME, callback_data=gl.YES_BUTTON_NAME)],
-        [InlineKeyboardButton(gl.NO_BUTTON_NAME, callback_data=gl.NO_BUTTON_NAME)]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
     message = f"{gl.TEXT_DATA['registration_question']['confirmation']}Ім'я: {name}\n" \
               f"Номер телефону: {phone_number}\nМісто: {city}\nEmail: {email}"
     await update.message.reply_text(message,
-                                    reply_markup=reply_markup,
+                                    reply_markup=keyboards.YES_NO,
                                     parse_mode="HTML")
     return gl.CONFIRMATION
 
@@ -188,8 +161,10 @@ async def registration_confirmation_handler(update: Update, context: ContextType
     Handle the user's confirmation and send registration data to the admin.
 
     If the user confirms the registration details, this function sends the
-    information to the admin and ends the conversation. If the user chooses not
-    to confirm, it restarts the registration process.
+    information to the admin and ends the conversation. A webinar registration is
+    stored first, and if the webinar has no free place left the user is told so and
+    the admin gets nothing. If the user chooses not to confirm, it restarts the
+    registration process.
 
     Args:
         update (Update): Incoming update object containing the user's callback query.
@@ -201,6 +176,11 @@ async def registration_confirmation_handler(update: Update, context: ContextType
     query = update.callback_query
     await query.answer()
     if query.data == gl.YES_BUTTON_NAME:
+        if context.user_data["registration_for"] == gl.REGISTRATION_FOR_WEBINAR \
+                and not await make_reminder(update, context):
+            await query.message.reply_text(gl.TEXT_DATA["webinar_full"], parse_mode="HTML")
+            return await finish_registration_menu(query, context)
+
         admin_chat_id = gl.ADMIN_CHAT_ID  # Replace with your admin chat ID
         name = context.user_data["name"]
         phone_number = context.user_data["phone_number"]
@@ -213,8 +193,6 @@ async def registration_confirmation_handler(update: Update, context: ContextType
         await context.bot.send_message(chat_id=admin_chat_id, text=message)
 
         await query.message.reply_text(gl.TEXT_DATA["registration_question"]["goodbye"])
-        if registration_for == gl.REGISTRATION_FOR_WEBINAR:
-            await make_reminder(update, context)
 
         return await finish_registration_menu(query, context)
     else:
@@ -235,13 +213,7 @@ async def finish_registration_menu(update: Update, context: ContextTypes.DEFAULT
     Returns:
         int: The state indicating that the bot is asking the user whether to start a new registration.
     """
-    keyboard = [
-        [InlineKeyboardButton(gl.YES_BUTTON_NAME, callback_data=gl.YES_BUTTON_NAME)],
-        [InlineKeyboardButton(gl.NO_BUTTON_NAME, callback_data=gl.NO_BUTTON_NAME)]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-
-    await update.message.reply_text(gl.TEXT_DATA["goodbye_question"], reply_markup=reply_markup)
+    await update.message.reply_text(gl.TEXT_DATA["goodbye_question"], reply_markup=keyboards.YES_NO)
     return gl.FINISH_REGISTRATION
 
 
@@ -0,0 +1,131 @@
+"""
+This script is a part of a Telegram bot that routes the menu selections to their handlers.
+Every menu is a routing table from the button text or callback data to a handler,
+so a selection is dispatched with a single dict lookup. The course and project menus
+are built from the buttons in texts.json and rebuilt when the texts are reloaded, so
+adding a course only needs a new entry in texts.json. The conversation states of the
+bot are declared here as well.
+"""
+import functools
+
+from telegram import Update
+from telegram.ext import CallbackQueryHandler, ContextTypes, MessageHandler, filters
+
+import chatbot.globals as gl
+import chatbot.affiliate_program as affiliate_program
+import chatbot.awards as awards
+import chatbot.courses as courses
+import chatbot.projects as projects
+import chatbot.registration as reg
+import chatbot.send_all as send_all
+import chatbot.webinars as webinars
+from chatbot.start import start, stop
+
+
+class Router:
+    """
+    Dispatch an update to the handler of the selected button.
+
+    Text messages are routed by their text and callback queries by their data.
+    Selections without a route are ignored and the conversation stays in its state.
+
+    Args:
+        routes (Callable[[], dict]): Returns the routing table from the selection to a
+            handler taking the update and the context.
+        admin_routes (dict): Additional routes that are only available in the admin chat.
+    """
+
+    def __init__(self, routes, admin_routes=None):
+        self.routes = routes
+        self.admin_routes = admin_routes or {}
+
+    async def __call__(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        query = update.callback_query
+        if query:
+            await query.answer()
+            selection = query.data
+        else:
+            selection = update.message.text
+
+        handler = self.routes().get(selection)
+        if handler is None and update.effective_chat.id == int(gl.ADMIN_CHAT_ID):
+            handler = self.admin_routes.get(selection)
+        if handler is None:
+            return None
+        return await handler(update, context)
+
+
+async def back_to_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    return await start(update.callback_query, context)
+
+
+def _static(routes: dict):
+    return lambda: routes
+
+
+def _menu_routes(buttons_key: str, show):
+    """Route the key of every button in the texts section, and its label for keyboards sent before."""
+    def build(texts):
+        routes = {gl.BACK_BUTTON_NAME: back_to_start}
+        for key, label in texts[buttons_key].items():
+            handler = functools.partial(show, key=key)
+            routes[key] = handler
+            routes.setdefault(label, handler)
+        return routes
+    return gl.TEXT_DATA.cached(build)
+
+
+start_menu = Router(_static({
+    gl.START_KEYBOARD_BUTTONS.courses: courses.courses_menu,
+    gl.START_KEYBOARD_BUTTONS.registration: functools.partial(
+        reg.register, registration_for=gl.REGISTRATION_FOR_CONSULTATION),
+    gl.START_KEYBOARD_BUTTONS.webinars: webinars.webinars_menu,
+    gl.START_KEYBOARD_BUTTONS.projects: projects.projects_menu,
+    gl.START_KEYBOARD_BUTTONS.cancel: stop,
+    gl.START_KEYBOARD_BUTTONS.awards: awards.awards_info,
+    gl.START_KEYBOARD_BUTTONS.affiliate_program: affiliate_program.affiliate_program_info,
+}), admin_routes={
+    gl.SET_WEBINAR_BUTTON: webinars.set_webinar_date,
+    gl.SEND_ALL_BUTTON: send_all.get_data_from_admin,
+})
+courses_menu = Router(_menu_routes("courses_buttons", courses.show_course))
+projects_menu = Router(_menu_routes("project_buttons", projects.show_project))
+
+
+def conversation_states() -> dict:
+    """
+    Build the states of the main ConversationHandler.
+
+    Returns:
+        dict: Handlers of every conversation state.
+    """
+    return {
+        gl.START_MENU: [MessageHandler(filters.TEXT & ~filters.COMMAND, start_menu)],
+        gl.COURSES_MENU: [CallbackQueryHandler(courses_menu)],
+        gl.COURSE_INFO_MENU: [CallbackQueryHandler(courses.course_info_handler)],
+        gl.ASK_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, reg.registration_phone),
+                      CallbackQueryHandler(reg.registration_phone)],
+        gl.ASK_NUMBER: [MessageHandler(filters.CONTACT, reg.registration_city),
+                        MessageHandler(filters.TEXT & ~filters.COMMAND, reg.registration_city)],
+        gl.ASK_CITY: [MessageHandler(filters.TEXT, reg.registration_email),
+                      CallbackQueryHandler(reg.registration_email)],
+        gl.ASK_EMAIL: [MessageHandler(filters.TEXT & ~filters.COMMAND, reg.registration_confirmation),
+                       CallbackQueryHandler(reg.registration_confirmation)],
+        gl.CONFIRMATION: [CallbackQueryHandler(reg.registration_confirmation_handler)],
+        gl.WEBINAR_MENU: [CallbackQueryHandler(webinars.webinars_handler)],
+        gl.PROJECT_MENU: [CallbackQueryHandler(projects_menu)],
+        gl.PROJECT_INFO_MENU: [CallbackQueryHandler(projects.project_info_handler)],
+        gl.FINISH_REGISTRATION: [CallbackQueryHandler(reg.finish_registration_handler)],
+        gl.SET_WEBINAR: [MessageHandler(filters.TEXT & ~filters.COMMAND, webinars.registration_webinar),
+                         CallbackQueryHandler(webinars.registration_webinar)],
+        gl.SET_WEBINAR_URL: [MessageHandler(filters.TEXT & ~filters.COMMAND, webinars.registration_webinar_url),
+                             CallbackQueryHandler(webinars.registration_webinar_url)],
+        gl.WAITING_FOR_MESSAGE: [
+            MessageHandler(filters.TEXT | filters.PHOTO | filters.ALL, send_all.receive_message),
+            CallbackQueryHandler(send_all.stop_collection, pattern="^stop$")],
+        gl.REVIEW_SCHEDULE: [CallbackQueryHandler(send_all.confirm_schedule, pattern="^confirm$"),
+                             CallbackQueryHandler(send_all.restart_collection, pattern="^start_over$")],
+        gl.WAITING_FOR_TIME: [MessageHandler(filters.TEXT & ~filters.COMMAND, send_all.receive_time)],
+        gl.AWARDS_MENU: [CallbackQueryHandler(awards.awards_handler)],
+        gl.AFFILIATE_PROGRAM_INFO_MENU: [CallbackQueryHandler(affiliate_program.affiliate_program_info_handler)],
+    }
@@ -1,12 +1,14 @@
 import datetime
 
-from telegram import Update, ReplyKeyboardRemove, InlineKeyboardMarkup, InlineKeyboardButton, InputMediaPhoto
+from telegram import Update, ReplyKeyboardRemove, InputMediaPhoto
 from telegram.ext import ContextTypes
 
 import chatbot.globals as gl
+import chatbot.keyboards as keyboards
 from chatbot.registration import finish_registration_menu
 from chatbot.webinars import is_valid_date
-from db.database import insert_scheduled_message, get_all_chat_ids_from_db
+import db.async_database as adb
+from db.job_store import job_store, BROADCAST
 
 
 async def get_data_from_admin(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -18,7 +20,7 @@ async def get_data_from_admin(update: Update, context: ContextTypes.DEFAULT_TYPE
     context.user_data['messages'] = []
     await update.message.reply_text(
         gl.TEXT_DATA["message_for_all"]["beginning"],
-        reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton(gl.STOP_BUTTON, callback_data="stop")]])
+        reply_markup=keyboards.STOP_COLLECTING
     )
     return gl.WAITING_FOR_MESSAGE
 
@@ -39,8 +41,7 @@ async def receive_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
         # Acknowledge receipt of individual messages or non-group media
         await update.message.reply_text(gl.TEXT_DATA["message_for_all"]["continue"],
-                                        reply_markup=InlineKeyboardMarkup(
-                                            [[InlineKeyboardButton(gl.STOP_BUTTON, callback_data="stop")]]))
+                                        reply_markup=keyboards.STOP_COLLECTING)
 
     return gl.WAITING_FOR_MESSAGE
 
@@ -71,14 +72,10 @@ async def stop_collection(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         await context.bot.send_media_group(chat_id=query.message.chat_id, media=media_group)
 
     # Inline buttons to proceed or restart
-    review_keyboard = [
-        [InlineKeyboardButton(gl.CONFIRM_SET_TIME_BUTTON, callback_data="confirm")],
-        [InlineKeyboardButton(gl.START_OVER_BUTTON, callback_data="start_over")]
-    ]
     await context.bot.send_message(
         chat_id=query.message.chat_id,
         text=gl.TEXT_DATA["message_for_all"]["confirmation"],
-        reply_markup=InlineKeyboardMarkup(review_keyboard)
+        reply_markup=keyboards.REVIEW_SCHEDULE
     )
     return gl.REVIEW_SCHEDULE
 
@@ -104,12 +101,8 @@ async def receive_time(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
     date_obj = datetime.datetime.strptime(data, "%d.%m.%Y %H:%M")
     date_obj = gl.TIMEZONE.localize(date_obj)  # Localize the datetime to your timezone
 
-    await save_to_db(context, data)
-    collected_messages = context.user_data.get('messages', [])
-    users = get_all_chat_ids_from_db()
-
-    for user in users:
-        context.job_queue.run_once(scheduled_msg, data=collected_messages, when=date_obj, chat_id=user, name=str(user))
+    message_id = await save_to_db(context, data, int(date_obj.timestamp()))
+    await job_store.schedule(BROADCAST, date_obj, entity_id=message_id)
 
     return await finish_registration_menu(update, context)
 
@@ -123,20 +116,7 @@ async def restart_collection(update: Update, context: ContextTypes.DEFAULT_TYPE)
     return gl.WAITING_FOR_MESSAGE
 
 
-async def scheduled_msg(context: ContextTypes.DEFAULT_TYPE) -> None:
-    job = context.job
-    text_messages = [msg for msg in job.data if msg['type'] == 'text']
-    photo_messages = [msg for msg in job.data if msg['type'] == 'photo']
-
-    for message in text_messages:
-        await context.bot.send_message(chat_id=job.chat_id, text=message['content'])
-
-    if photo_messages:
-        media_group = [InputMediaPhoto(media=msg['file_id']) for msg in photo_messages]
-        await context.bot.send_media_group(chat_id=job.chat_id, media=media_group)
-
-
-async def save_to_db(context: ContextTypes.DEFAULT_TYPE, data) -> None:
+async def save_to_db(context: ContextTypes.DEFAULT_TYPE, data, scheduled_at: int) -> int:
     collected_messages = context.user_data.get('messages', [])
     text_messages = [msg["content"] for msg in collected_messages if msg['type'] == 'text']
     photo_messages = [msg['file_id'] for msg in collected_messages if msg['type'] == 'photo']
@@ -144,4 +124,5 @@ async def save_to_db(context: ContextTypes.DEFAULT_TYPE, data) -> None:
     text_messages_single_line = gl.SEPERATOR.join(text_messages)
     photo_messages_single_line = gl.SEPERATOR.join(photo_messages)
 
-    insert_scheduled_message(data, text_messages_single_line, photo_messages_single_line)
+    return await adb.insert_scheduled_message(data, scheduled_at, text_messages_single_line,
+                                              photo_messages_single_line)
@@ -5,15 +5,20 @@ to display the main menu, handle the termination of conversations, and schedule
 notifications.
 """
 import datetime
+import functools
 
-from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove, InputMediaPhoto
+from telegram import Update, ReplyKeyboardRemove
 from telegram.ext import ContextTypes, ConversationHandler
 
 import chatbot.globals as gl
-from db.database import insert_user, \
-    get_webinars_info, get_all_scheduled_messages, \
-    get_all_chat_ids_from_db, delete_scheduled_message_by_time, \
-    insert_webinar_user, get_future_webinars_and_delete_past
+import chatbot.keyboards as keyboards
+import chatbot.lifecycle as lifecycle
+from chatbot.broadcast import Broadcaster
+import db.async_database as adb
+from db.database import ALREADY_REGISTERED, WEBINAR_FULL
+from db.job_store import job_store, REMINDER
+from db.upcoming_webinars import upcoming_webinars
+from db.user_buffer import user_buffer
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -32,19 +37,13 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     Returns:
         int: The state indicating that the bot is now in the main menu.
     """
-    keyboard_buttons = [[button] for button in gl.START_KEYBOARD_BUTTONS]
     chat_id = update.message.chat_id
     if chat_id != int(gl.ADMIN_CHAT_ID):
-        insert_user(chat_id)
-
-    if chat_id == int(gl.ADMIN_CHAT_ID):
-        keyboard_buttons.append([gl.SET_WEBINAR_BUTTON])
-        keyboard_buttons.append([gl.SEND_ALL_BUTTON])
-    reply_markup = ReplyKeyboardMarkup(keyboard_buttons, one_time_keyboard=True, resize_keyboard=True)
+        await user_buffer.add(chat_id)
 
     await update.message.reply_text(
         gl.TEXT_DATA["greetings"],
-        reply_markup=reply_markup,
+        reply_markup=keyboards.start_menu(chat_id),
         parse_mode="HTML"
     )
     return gl.START_MENU
@@ -68,98 +67,68 @@ async def stop(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     return ConversationHandler.END
 
 
-async def make_reminder(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def make_reminder(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
     """
     Schedule a reminder for an upcoming event (e.g., a webinar).
 
-    This function calculates the time for a reminder notification based on the
-    event's date and time, then schedules a job to send this reminder message
-    to the user at the appropriate time.
+    This function calculates the time for a reminder notification based on the start
+    of the webinar the user chose and stores the registration. All registrants of a
+    webinar share one job, which is scheduled with the first registration. Registering
+    for the same webinar again neither adds a row nor schedules anything.
 
     Args:
         update (Update): Incoming update object containing the user's message.
         context (ContextTypes.DEFAULT_TYPE): Context object to maintain data across user sessions.
+
+    Returns:
+        bool: False if the webinar had no free place left, True otherwise.
     """
     chat_id = update.effective_message.chat_id
-    webinar_data, webinar_url = get_webinars_info()
-    date_obj = datetime.datetime.strptime(webinar_data, "%d.%m.%Y %H:%M") - datetime.timedelta(hours=gl.HOURS_REMIND)
-    date_obj = gl.TIMEZONE.localize(date_obj)  # Localize the datetime to your timezone
-    insert_webinar_user(chat_id, date_obj, webinar_url)
-    context.job_queue.run_once(webinar_reminder, data=webinar_url, when=date_obj, chat_id=chat_id, name=str(chat_id))
-
-
-async def webinar_reminder(context: ContextTypes.DEFAULT_TYPE) -> None:
+    webinar_id = context.user_data.get("webinar_id")
+    webinar = await upcoming_webinars.get(webinar_id) if webinar_id \
+        else next(iter(await upcoming_webinars.all()), None)
+    if webinar is None:
+        # Removed or started while the user was registering
+        return True
+    date_obj = datetime.datetime.fromtimestamp(webinar.starts_at, gl.TIMEZONE) \
+        - datetime.timedelta(hours=gl.HOURS_REMIND)
+    result = await adb.insert_webinar_user(chat_id, date_obj, webinar.url, webinar.id)
+    if result == WEBINAR_FULL:
+        # The last places went while the user was registering, reload the counts
+        upcoming_webinars.invalidate()
+        return False
+    if result == ALREADY_REGISTERED:
+        return True
+    upcoming_webinars.count_registration(webinar.id)
+    if date_obj > datetime.datetime.now(gl.TIMEZONE):
+        # The reminder of a later registrant is sent by the bucket's job, it reads the registrants when it runs
+        await job_store.schedule(REMINDER, date_obj, entity_id=webinar.id, payload={"url": webinar.url}, unique=True)
+    return True
+
+
+async def webinar_reminder(context: ContextTypes.DEFAULT_TYPE) -> bool:
     """
-    Send the alarm message to the user.
+    Send the alarm message to every registrant of the reminder time.
 
-    This function is triggered by a scheduled job to send a reminder message
-    to the user about an upcoming event.
+    This function is triggered by the scheduled job of a reminder time. The registrants
+    are read in pages and served by the rate limited broadcaster, and the id of the last
+    served registration is stored with the job, so a reminder interrupted by a restart
+    continues where it stopped.
 
     Args:
-        context (ContextTypes.DEFAULT_TYPE): Context object containing job data and bot information.
-    """
-    job = context.job
-    text = gl.TEXT_DATA["webinar_reminder"].format(gl.HOURS_REMIND, job.data)
-    await context.bot.send_message(job.chat_id, text=text)
-
+        context (ContextTypes.DEFAULT_TYPE): Context object containing the stored job and bot information.
 
-def remove_all_jobs(context):
-    """
-    Remove all jobs from the job queue.
-
-    This function retrieves all currently scheduled jobs in the job queue and
-    schedules each one for removal, effectively canceling them.
-
-    Args:
-        context (telegram.ext.CallbackContext): The context object containing the job queue.
+    Returns:
+        bool: True if every registrant was reminded, False if the reminder was interrupted.
     """
-    jobs = context.job_queue.jobs()
-
-    # Iterate over the jobs and remove each one
-    for job in jobs:
-        job.schedule_removal()
-
-
-def restore_all_jobs(application) -> None:
-    users = get_all_chat_ids_from_db()
-    all_scheduled_messages = get_all_scheduled_messages()
-    for user in users:
-        for message in all_scheduled_messages:
-            scheduled_time = message[0]
-            date_obj = datetime.datetime.strptime(scheduled_time, "%d.%m.%Y %H:%M")
-            date_obj = gl.TIMEZONE.localize(date_obj)  # Localize the datetime to your timezone
-            now = datetime.datetime.now(gl.TIMEZONE)
-            if now > date_obj:
-                delete_scheduled_message_by_time(scheduled_time)
-                continue
-
-            application.job_queue.run_once(send_message,
-                                           data=message,
-                                           when=date_obj,
-                                           chat_id=user,
-                                           name=str(user))
-
-
-async def send_message(application):
-    message = application.job.data
-
-    text_messages, photo_messages = message[1].split(gl.SEPERATOR), message[2].split(gl.SEPERATOR)
-    for message in text_messages:
-        await application.bot.send_message(chat_id=application.job.chat_id, text=message)
-
-    if photo_messages:
-        media_group = [InputMediaPhoto(media=msg) for msg in photo_messages]
-        await application.bot.send_media_group(chat_id=application.job.chat_id, media=media_group)
-
-
-def restore_all_webinars(application) -> None:
-    webinars_info = get_future_webinars_and_delete_past()
-    for info in webinars_info:
-        user_chat_id, webinar_data, webinar_url = info
-        webinar_data = datetime.datetime.fromisoformat(webinar_data)
-        application.job_queue.run_once(webinar_reminder,
-                                       data=webinar_url,
-                                       when=webinar_data,
-                                       chat_id=user_chat_id,
-                                       name=str(user_chat_id))
+    job = context.job.data
+    text = gl.TEXT_DATA["webinar_reminder"].format(gl.HOURS_REMIND, job.payload["url"])
+    report = await Broadcaster(context.bot).run(
+        adb.iter_reminder_recipient_pages(job.entity_id, job.run_at, job.cursor or 0),
+        {"texts": [text], "photos": []},
+        on_page=functools.partial(job_store.set_cursor, job.id),
+        stop=lifecycle.stopping,
+        source=(job.kind, job.id),
+    )
+    return not report.interrupted
 
@@ -0,0 +1,47 @@
+"""
+This script is a part of a Telegram bot that shows the admin how the latest broadcasts
+and webinar reminders were delivered: the number of recipients, delivered, blocked and
+failed messages, throughput, latency and attempts per recipient, followed by the most
+frequent Telegram errors of the last day. The figures are aggregated from the delivery
+ledger.
+"""
+import time
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+import chatbot.globals as gl
+import db.async_database as adb
+from db.delivery_ledger import delivery_ledger, get_error_counts, get_job_stats
+
+
+def _describe(stats) -> str:
+    # Deliveries run concurrently, so the job took from its first start to its last finish
+    elapsed = stats.finished_at - stats.started_at
+    throughput = stats.total / elapsed if elapsed > 0 else stats.total
+    return gl.TEXT_DATA["stats"]["run"].format(
+        stats.source, stats.source_id, stats.total, stats.sent, stats.blocked, stats.failed,
+        round(throughput, 1), round(stats.latency_ms), round(stats.attempts, 2))
+
+
+async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Send the delivery statistics of the latest broadcasts and reminders to the admin.
+
+    Args:
+        update (Update): Incoming update object containing the /stats command.
+        context (ContextTypes.DEFAULT_TYPE): Context object to maintain data across user sessions.
+    """
+    # Deliveries still in memory are counted too
+    await delivery_ledger.flush()
+    jobs = await adb.run(get_job_stats)
+    if not jobs:
+        await update.message.reply_text(gl.TEXT_DATA["stats"]["empty"])
+        return
+
+    parts = [_describe(job) for job in jobs]
+    errors = await adb.run(get_error_counts, time.time() - 24 * 60 * 60)
+    if errors:
+        parts.append("\n".join([gl.TEXT_DATA["stats"]["errors"],
+                                *(f"{error}: {count}" for error, count in errors)]))
+    await update.message.reply_text("\n\n".join(parts))
@@ -0,0 +1,210 @@
+"""
+This script is a part of a Telegram bot that provides the user-facing texts from
+static/texts.json. The file is validated against the keys the handlers use, so a
+missing text stops the bot at startup instead of failing a user's request later.
+The fields of the format templates are checked once when the file is loaded.
+
+The loaded texts are an immutable snapshot. The catalog checks the modification time
+of the file and swaps in a new snapshot when it changed, so texts can be edited
+without a restart. An invalid file is logged and the previous snapshot stays in use.
+"""
+import json
+import logging
+import os
+import string
+from collections.abc import Mapping
+from types import MappingProxyType
+
+logger = logging.getLogger(__name__)
+
+# Texts looked up by the handlers, nested keys are separated by dots
+REQUIRED_KEYS = (
+    "greetings", "goodbye", "goodbye_question",
+    "courses_greetings", "courses_menu",
+    "project_greetings", "project_menu",
+    "webinar_greetings", "webinar_unplanned", "set_webinar_time", "set_webinar_false", "webinar_wrong_date",
+    "webinar_set_date_successful", "webinar_remove_date_successful", "webinar_full",
+    "registration_question.name", "registration_question.phone", "registration_question.city_1",
+    "registration_question.city_2", "registration_question.email_1", "registration_question.email_2",
+    "registration_question.confirmation", "registration_question.goodbye", "registration_question.admin",
+    "message_for_all.start_message", "message_for_all.beginning", "message_for_all.continue",
+    "message_for_all.nothing", "message_for_all.confirmation", "message_for_all.time", "message_for_all.restart",
+    "stats.empty", "stats.errors",
+    "awards_greetings", "awards_info", "awards_image_path",
+    "affiliate_program_greetings", "affiliate_program_info",
+)
+
+# Menus built from the texts: every button key needs its content in the info section.
+# The content is either a text or a gallery with "text", "image_path" and "end_text".
+MENUS = {
+    "courses_buttons": "courses_info",
+    "project_buttons": "project_info",
+}
+GALLERY_KEYS = ("text", "image_path", "end_text")
+
+# Texts used with .format and the number of values they get
+TEMPLATES = {
+    "webinar_reminder": 2,
+    "set_webinar_true": 1,
+    "webinar_places": 1,
+    "message_for_all.report": 5,
+    "stats.run": 9,
+}
+
+
+def _field_count(key: str, text: str) -> int:
+    """
+    Count the values a template takes, raising ValueError for a field .format can't fill.
+    """
+    fields = set()
+    auto_index = 0
+    try:
+        parsed = list(string.Formatter().parse(text))
+    except ValueError as error:
+        raise ValueError(f"Text {key} is not a valid template: {error}") from None
+    for _, field, format_spec, _ in parsed:
+        if field is None:
+            continue
+        if "." in field or "[" in field or "{" in format_spec:
+            raise ValueError(f"Text {key} has an unsupported field {{{field}}}")
+        if field == "":
+            field, auto_index = str(auto_index), auto_index + 1
+        fields.add(field)
+    return len(fields)
+
+
+def _lookup(data, key: str):
+    for part in key.split("."):
+        if not isinstance(data, Mapping) or part not in data:
+            return None
+        data = data[part]
+    return data
+
+
+def _freeze(data):
+    if isinstance(data, dict):
+        return MappingProxyType({key: _freeze(value) for key, value in data.items()})
+    if isinstance(data, list):
+        return tuple(_freeze(value) for value in data)
+    return data
+
+
+def compile_texts(data: dict) -> MappingProxyType:
+    """
+    Validate the texts and build an immutable snapshot of them.
+
+    Args:
+        data (dict): The parsed texts.json content.
+
+    Returns:
+        MappingProxyType: Read-only texts.
+
+    Raises:
+        ValueError: If a required text is missing or a template has the wrong number of fields.
+    """
+    missing = [key for key in (*REQUIRED_KEYS, *TEMPLATES) if not isinstance(_lookup(data, key), str)]
+    for buttons_key, info_key in MENUS.items():
+        buttons = data.get(buttons_key)
+        if not isinstance(buttons, dict) or not buttons:
+            missing.append(buttons_key)
+            continue
+        for key, label in buttons.items():
+            content = _lookup(data, f"{info_key}.{key}")
+            if not isinstance(label, str):
+                missing.append(f"{buttons_key}.{key}")
+            if isinstance(content, dict):
+                missing.extend(f"{info_key}.{key}.{part}" for part in GALLERY_KEYS
+                               if not isinstance(content.get(part), str))
+            elif not isinstance(content, str):
+                missing.append(f"{info_key}.{key}")
+    if missing:
+        raise ValueError(f"Missing texts: {', '.join(missing)}")
+
+    for key, field_count in TEMPLATES.items():
+        found = _field_count(key, _lookup(data, key))
+        if found != field_count:
+            raise ValueError(f"Text {key} must have {field_count} fields, it has {found}")
+    return _freeze(data)
+
+
+class TextCatalog:
+    """
+    The current snapshot of the texts, reloaded when the file changes.
+
+    Indexing the catalog looks up the current snapshot, so gl.TEXT_DATA["greetings"]
+    always returns the latest valid text.
+
+    Args:
+        path (str): Path to the texts JSON file.
+
+    Raises:
+        ValueError: If the file is not valid JSON or a required text is missing.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.snapshot, self.version = self._read()
+        self.rejected_version = self.version
+
+    def __getitem__(self, key: str):
+        return self.snapshot[key]
+
+    def _read(self):
+        stat = os.stat(self.path)
+        with open(self.path, "r") as text:
+            snapshot = compile_texts(json.load(text))
+        return snapshot, (stat.st_mtime_ns, stat.st_size)
+
+    def reload(self) -> bool:
+        """
+        Swap in the texts from the file if it changed since the last load.
+
+        Returns:
+            bool: True if new texts were loaded.
+        """
+        try:
+            stat = os.stat(self.path)
+            version = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            version = None
+        if version in (self.version, self.rejected_version):
+            return False
+
+        try:
+            snapshot, version = self._read()
+        except (OSError, ValueError) as error:
+            # Logged once per change of the file
+            self.rejected_version = version
+            logger.error("Keeping the current texts, %s is invalid: %s", self.path, error)
+            return False
+
+        self.snapshot, self.version = snapshot, version
+        logger.info("Reloaded texts from %s", self.path)
+        return True
+
+    def cached(self, build):
+        """
+        Cache a value derived from the texts until they are reloaded.
+
+        Args:
+            build (Callable[[MappingProxyType], Any]): Builds the value from a snapshot.
+
+        Returns:
+            Callable[[], Any]: Returns the value for the current snapshot.
+        """
+        cache = [None, None]
+
+        def get():
+            if cache[0] is not self.snapshot:
+                snapshot = self.snapshot
+                cache[:] = snapshot, build(snapshot)
+            return cache[1]
+        return get
+
+    async def watch(self, context=None) -> None:
+        """
+        Reload the texts if the file changed.
+
+        Can be used directly as a JobQueue callback.
+        """
+        self.reload()
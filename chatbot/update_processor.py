@@ -0,0 +1,94 @@
+"""
+This script is a part of a Telegram bot that decides how incoming updates are processed.
+Updates from different chats are processed concurrently up to a configurable limit,
+while updates from the same chat are processed strictly one after another in the order
+they arrived, so the ConversationHandler state of a chat is never changed by two
+handlers at once. The processor also keeps queue depth and wait time metrics.
+"""
+import asyncio
+import time
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """
+    Process updates of different chats concurrently and updates of one chat in order.
+
+    Args:
+        max_concurrent_updates (int): Maximum number of updates processed at the same time.
+        max_pending_updates (int): Maximum number of updates that are waiting or processed.
+    """
+
+    def __init__(self, max_concurrent_updates: int, max_pending_updates: int):
+        # The base class semaphore is taken before the chat lock, so it only bounds the
+        # number of pending updates. The real concurrency limit is applied after the lock,
+        # otherwise updates waiting for a busy chat would take the slots of other chats.
+        super().__init__(max(max_pending_updates, max_concurrent_updates))
+        self._running = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._chat_locks = {}
+        self._chat_pending = {}
+        self.pending = 0
+        self.running = 0
+        self.processed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    async def do_process_update(self, update: object, coroutine) -> None:
+        chat_id = update.effective_chat.id if isinstance(update, Update) and update.effective_chat else None
+        queued = time.monotonic()
+        self.pending += 1
+        try:
+            if chat_id is None:
+                async with self._running:
+                    await self._process(coroutine, queued)
+                return
+
+            lock = self._chat_locks.setdefault(chat_id, asyncio.Lock())
+            self._chat_pending[chat_id] = self._chat_pending.get(chat_id, 0) + 1
+            try:
+                async with lock, self._running:
+                    await self._process(coroutine, queued)
+            finally:
+                self._chat_pending[chat_id] -= 1
+                if not self._chat_pending[chat_id]:
+                    del self._chat_pending[chat_id]
+                    del self._chat_locks[chat_id]
+        finally:
+            self.pending -= 1
+
+    async def _process(self, coroutine, queued: float) -> None:
+        wait = time.monotonic() - queued
+        self.processed += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.running += 1
+        try:
+            await coroutine
+        finally:
+            self.running -= 1
+
+    def metrics(self) -> dict:
+        """
+        Return the current queue depth and the wait time statistics.
+
+        Returns:
+            dict: Pending and running updates, chats with pending updates, processed
+            updates and their average and maximum wait time in milliseconds.
+        """
+        return {
+            "pending_updates": self.pending,
+            "waiting_updates": self.pending - self.running,
+            "running_updates": self.running,
+            "busy_chats": len(self._chat_pending),
+            "processed_updates": self.processed,
+            "average_wait_ms": round(self.total_wait / self.processed * 1000, 1) if self.processed else 0,
+            "max_wait_ms": round(self.max_wait * 1000, 1),
+        }
+
+    async def initialize(self) -> None:
+        """Nothing to set up."""
+
+    async def shutdown(self) -> None:
+        """Nothing to free."""
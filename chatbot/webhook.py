@@ -0,0 +1,89 @@
+"""
+This script is a part of a Telegram bot that receives updates through a webhook
+instead of long polling. It runs an aiohttp server that accepts the updates Telegram
+posts to WEBHOOK_PATH, checks the secret token Telegram sends with every request and
+hands the updates to the application. A health endpoint reports whether the
+application is running, so the container and the restart script can check it.
+The application itself is run by chatbot.lifecycle.
+"""
+import hmac
+import logging
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+
+import chatbot.globals as gl
+
+logger = logging.getLogger(__name__)
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def make_web_app(application: Application) -> web.Application:
+    """
+    Create the aiohttp application serving the webhook and the health endpoint.
+
+    Args:
+        application (Application): The bot application the updates are passed to.
+
+    Returns:
+        web.Application: The configured aiohttp application.
+    """
+    async def handle_update(request: web.Request) -> web.Response:
+        # Without a configured secret every update is rejected, compared in constant time
+        secret = request.headers.get(SECRET_TOKEN_HEADER, "")
+        if not gl.WEBHOOK_SECRET or not hmac.compare_digest(secret.encode(), gl.WEBHOOK_SECRET.encode()):
+            return web.Response(status=403)
+        try:
+            update = Update.de_json(await request.json(), application.bot)
+        except ValueError:
+            return web.Response(status=400)
+        await application.update_queue.put(update)
+        return web.Response()
+
+    async def handle_health(request: web.Request) -> web.Response:
+        health = {"running": application.running, "queued_updates": application.update_queue.qsize()}
+        if hasattr(application.update_processor, "metrics"):
+            health.update(application.update_processor.metrics())
+        return web.json_response(health, status=200 if application.running else 503)
+
+    web_app = web.Application()
+    web_app.router.add_post(gl.WEBHOOK_PATH, handle_update)
+    if gl.HEALTH_PATH:
+        web_app.router.add_get(gl.HEALTH_PATH, handle_health)
+    return web_app
+
+
+class WebhookReceiver:
+    """
+    Receives the updates through the webhook server.
+
+    The server is bound with SO_REUSEPORT, so while a new process takes over, both
+    processes listen on the port. The old process closes its socket as soon as it
+    starts shutting down, and the new one queues the updates until it starts.
+
+    Args:
+        application (Application): The bot application the updates are passed to.
+    """
+
+    def __init__(self, application: Application):
+        self.application = application
+        self.runner = None
+
+    async def listen(self) -> None:
+        self.runner = web.AppRunner(make_web_app(self.application))
+        await self.runner.setup()
+        await web.TCPSite(self.runner, port=gl.WEBHOOK_PORT, reuse_port=True).start()
+        logger.info("Listening for webhook updates on port %s", gl.WEBHOOK_PORT)
+
+    async def start(self) -> None:
+        await self.application.bot.set_webhook(url=gl.WEBHOOK_URL + gl.WEBHOOK_PATH,
+                                               secret_token=gl.WEBHOOK_SECRET,
+                                               allowed_updates=Update.ALL_TYPES,
+                                               max_connections=gl.WEBHOOK_MAX_CONNECTIONS)
+
+    async def stop(self) -> None:
+        if self.runner is not None:
+            runner, self.runner = self.runner, None
+            await runner.cleanup()
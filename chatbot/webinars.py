@@ -1,16 +1,15 @@
 """
 This script is a component of a Telegram bot designed to handle interactions related
 to webinars. It provides functionality for displaying webinar information, handling
-user registrations, and allowing an admin to set the webinar date.
+user registrations, and allowing an admin to plan and remove webinars. Several
+webinars can be planned at once; the upcoming ones are served from memory.
 """
 import datetime
 
-from db.database import get_webinar_data, set_webinar_data, delete_webinar_data
+from db.upcoming_webinars import upcoming_webinars
 
 from telegram import (
     Update,
-    InlineKeyboardButton,
-    InlineKeyboardMarkup,
     ReplyKeyboardRemove
 )
 
@@ -19,7 +18,8 @@ from telegram.ext import (
 )
 
 import chatbot.globals as gl
-from chatbot.start import start, remove_all_jobs
+import chatbot.keyboards as keyboards
+from chatbot.start import start
 import chatbot.registration as reg
 
 
@@ -27,9 +27,9 @@ async def webinars_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     Display the webinar menu to the user.
 
-    This function checks if a webinar date is set. If not, it informs the user that
-    no webinar is currently planned. Otherwise, it displays the webinar information
-    and provides options for registration or returning to the previous menu.
+    This function checks if any webinar is planned. If not, it informs the user that
+    no webinar is currently planned. Otherwise, it lists the upcoming webinars and
+    provides a registration button for every webinar with free places.
 
     Args:
         update (Update): Incoming update object containing the user's message.
@@ -38,8 +38,8 @@ async def webinars_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     Returns:
         int: The state indicating the bot is now in the webinar menu, or None if no webinar is planned.
     """
-    webinar_data = get_webinar_data()
-    if not webinar_data:
+    webinars = await upcoming_webinars.all()
+    if not webinars:
         await update.message.reply_text(
             gl.TEXT_DATA["webinar_unplanned"],
             parse_mode="HTML",
@@ -52,15 +52,12 @@ async def webinars_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
         reply_markup=ReplyKeyboardRemove()
     )
 
-    keyboard = [
-        [InlineKeyboardButton(gl.REGISTRATION_NAMES.registration_webinar, callback_data=gl.REGISTRATION_CALLBACK)],
-        [InlineKeyboardButton(gl.BACK_BUTTON_NAME, callback_data=gl.BACK_BUTTON_NAME)]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-
+    lines = [webinar.date_text if not upcoming_webinars.is_full(webinar)
+             else f"{webinar.date_text} — {gl.TEXT_DATA['webinar_full']}" for webinar in webinars]
     await update.message.reply_text(
-        text=webinar_data[0],
-        reply_markup=reply_markup,
+        text="\n".join(lines),
+        reply_markup=keyboards.webinars_menu([webinar for webinar in webinars
+                                              if not upcoming_webinars.is_full(webinar)]),
         parse_mode="HTML"
     )
     return gl.WEBINAR_MENU
@@ -71,8 +68,8 @@ async def webinars_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -
      Handle user selections in the webinar menu.
 
      This function processes the user's selection from the webinar menu. It either
-     navigates back to the start menu or proceeds with the registration process
-     depending on the user's choice.
+     navigates back to the start menu or proceeds with the registration for the
+     chosen webinar, if it still has free places.
 
      Args:
          update (Update): Incoming update object containing the user's interaction.
@@ -85,16 +82,27 @@ async def webinars_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     await query.answer()
     if query.data == gl.BACK_BUTTON_NAME:
         return await start(query, context)
-    elif query.data == gl.REGISTRATION_CALLBACK:
+    elif query.data.startswith(gl.REGISTRATION_CALLBACK):
+        # The menus sent before several webinars were possible have no webinar id, they mean the next one
+        _, _, webinar_id = query.data.partition(":")
+        webinar = await upcoming_webinars.get(int(webinar_id)) if webinar_id \
+            else next(iter(await upcoming_webinars.all()), None)
+        if webinar is None:
+            await query.message.reply_text(gl.TEXT_DATA["webinar_unplanned"], parse_mode="HTML")
+            return await start(query, context)
+        if upcoming_webinars.is_full(webinar):
+            await query.message.reply_text(gl.TEXT_DATA["webinar_full"], parse_mode="HTML")
+            return await start(query, context)
+        context.user_data["webinar_id"] = webinar.id
         return await reg.register(query, context, gl.REGISTRATION_FOR_WEBINAR)
 
 
 async def set_webinar_date(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """
-    Prompt the admin to set or confirm the webinar date.
+    Prompt the admin to add or remove a webinar.
 
-    This function sends a message to the admin, indicating whether a webinar date
-    is currently set or not, and asks for input to set or update the date.
+    This function sends a message to the admin with the planned webinars, if there
+    are any, and asks for the link of a new webinar or the number of one to remove.
 
     Args:
         update (Update): Incoming update object containing the admin's message.
@@ -103,17 +111,13 @@ async def set_webinar_date(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     Returns:
         int: The state indicating the bot is now waiting for the webinar date to be set.
     """
-    keyboard = [
-        [InlineKeyboardButton(gl.BACK_BUTTON_NAME, callback_data=gl.BACK_BUTTON_NAME)]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    webinar_data = get_webinar_data()
+    webinars = await upcoming_webinars.all()
 
-    text = gl.TEXT_DATA["set_webinar_true"].format(webinar_data) if webinar_data \
-        else gl.TEXT_DATA["set_webinar_false"]
+    text = gl.TEXT_DATA["set_webinar_true"].format("\n".join(_describe(webinar) for webinar in webinars)) \
+        if webinars else gl.TEXT_DATA["set_webinar_false"]
 
     await update.message.reply_text(text,
-                                    reply_markup=reply_markup,
+                                    reply_markup=keyboards.BACK,
                                     parse_mode="HTML",)
     return gl.SET_WEBINAR_URL
 
@@ -125,32 +129,35 @@ async def registration_webinar_url(update: Update, context: ContextTypes.DEFAULT
         return await start(query, context)
 
     data = update.message.text
-    if data == "-":
-        remove_all_jobs(context)
-        delete_webinar_data()
+    if data.startswith("-"):
+        # "-" alone removes the next webinar, "-N" the webinar N, anything else is asked again
+        number = data[1:].strip()
+        if number and not number.isdecimal():
+            return await set_webinar_date(update, context)
+        webinar = await upcoming_webinars.get(int(number)) if number \
+            else next(iter(await upcoming_webinars.all()), None)
+        if webinar is None:
+            return await set_webinar_date(update, context)
+        await upcoming_webinars.remove(webinar.id)
         await update.message.reply_text(gl.TEXT_DATA["webinar_remove_date_successful"],
                                         parse_mode="HTML")
         return await reg.finish_registration_menu(update, context)
 
     context.user_data['url'] = data
 
-    keyboard = [
-        [InlineKeyboardButton(gl.BACK_BUTTON_NAME, callback_data=gl.BACK_BUTTON_NAME)]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-
     await update.message.reply_text(gl.TEXT_DATA["set_webinar_time"],
-                                    reply_markup=reply_markup,
+                                    reply_markup=keyboards.BACK,
                                     parse_mode="HTML",)
     return gl.SET_WEBINAR
 
 
 async def registration_webinar(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
-    Handle the admin's input for setting the webinar date.
+    Handle the admin's input for the date of a new webinar.
 
-    This function validates the date format entered by the admin. If valid, it saves
-    the date; otherwise, it prompts the admin to enter a valid date.
+    This function validates the date format entered by the admin, optionally followed
+    by the number of places. If valid, it saves the new webinar; otherwise, it prompts
+    the admin to enter a valid date.
 
     Args:
         update (Update): Incoming update object containing the admin's message.
@@ -164,18 +171,28 @@ async def registration_webinar(update: Update, context: ContextTypes.DEFAULT_TYP
         await query.answer()
         return await start(query, context)
 
-    data = update.message.text
-    if not is_valid_date(data):
+    data = update.message.text.strip()
+    date_text, _, capacity = data.rpartition(" ")
+    if not (capacity.isdigit() and is_valid_date(date_text)):
+        date_text, capacity = data, None
+    if not is_valid_date(date_text):
         await update.message.reply_text(gl.TEXT_DATA["webinar_wrong_date"],
                                         parse_mode="HTML")
         return await set_webinar_date(update, context)
 
-    set_webinar_data(data, context.user_data['url'])
+    starts_at = gl.TIMEZONE.localize(datetime.datetime.strptime(date_text, "%d.%m.%Y %H:%M"))
+    await upcoming_webinars.add(date_text, context.user_data['url'], starts_at,
+                                int(capacity) if capacity else None)
     await update.message.reply_text(gl.TEXT_DATA["webinar_set_date_successful"],
                                     parse_mode="HTML")
     return await reg.finish_registration_menu(update, context)
 
 
+def _describe(webinar) -> str:
+    places = gl.TEXT_DATA["webinar_places"].format(webinar.capacity) if webinar.capacity is not None else ""
+    return f"{webinar.id}. {webinar.date_text} {webinar.url}{places}"
+
+
 def is_valid_date(date_string: str) -> bool:
     """
     Validate the format of the provided date string.
@@ -0,0 +1,95 @@
+"""
+Asynchronous access to the database helpers.
+
+The helpers in db/database.py are blocking, so calling them from a handler stalls
+every other update while SQLite waits for the disk. Here every helper has an
+awaitable twin that sends the call to a single dedicated database thread and waits
+for the result without blocking the event loop. The thread works through the calls
+one by one and keeps its own long-lived connection.
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from db import database
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db")
+
+
+async def run(func, *args, **kwargs):
+    """
+    Run a blocking function on the database thread.
+
+    Args:
+        func (Callable): The function to run.
+        *args: Positional arguments for the function.
+        **kwargs: Keyword arguments for the function.
+
+    Returns:
+        Any: The result of the function.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+def _in_db_thread(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run(func, *args, **kwargs)
+    return wrapper
+
+
+def shutdown() -> None:
+    """Wait for the queued calls to finish and stop the database thread."""
+    _executor.shutdown(wait=True)
+
+
+insert_users = _in_db_thread(database.insert_users)
+deactivate_users = _in_db_thread(database.deactivate_users)
+insert_scheduled_message = _in_db_thread(database.insert_scheduled_message)
+get_chat_id_page = _in_db_thread(database.get_chat_id_page)
+insert_webinar = _in_db_thread(database.insert_webinar)
+get_upcoming_webinars = _in_db_thread(database.get_upcoming_webinars)
+delete_past_webinars = _in_db_thread(database.delete_past_webinars)
+get_scheduled_message = _in_db_thread(database.get_scheduled_message)
+set_scheduled_message_cursor = _in_db_thread(database.set_scheduled_message_cursor)
+delete_scheduled_message = _in_db_thread(database.delete_scheduled_message)
+insert_webinar_user = _in_db_thread(database.insert_webinar_user)
+get_reminder_recipients_page = _in_db_thread(database.get_reminder_recipients_page)
+get_all_media_files = _in_db_thread(database.get_all_media_files)
+set_media_file = _in_db_thread(database.set_media_file)
+delete_media_files = _in_db_thread(database.delete_media_files)
+
+
+async def iter_chat_id_pages(after_user_id=0, page_size=500):
+    """
+    Lazily iterates over active users in pages ordered by user id.
+
+    Args:
+        after_user_id (int): Only users with a greater id are returned.
+        page_size (int): Number of users in a page.
+
+    Yields:
+        list: A list of (user id, chat id) rows.
+    """
+    while page := await get_chat_id_page(after_user_id, page_size):
+        yield page
+        after_user_id = page[-1][0]
+
+
+async def iter_reminder_recipient_pages(webinar_id, remind_at, after_id=0, page_size=500):
+    """
+    Lazily iterates over the webinar registrants reminded at the given time in pages ordered by registration id.
+
+    Args:
+        webinar_id (int): Id of the webinar.
+        remind_at (int): Reminder time in epoch seconds.
+        after_id (int): Only registrations with a greater id are returned.
+        page_size (int): Number of registrations in a page.
+
+    Yields:
+        list: A list of (registration id, chat id) rows.
+    """
+    while page := await get_reminder_recipients_page(webinar_id, remind_at, after_id, page_size):
+        yield page
+        after_id = page[-1][0]
@@ -0,0 +1,90 @@
+"""
+Long-lived SQLite connections for the database helpers.
+
+Every thread gets its own connection that is opened once and reused for all queries.
+The connection runs in WAL mode with synchronous=NORMAL and a busy timeout, and keeps
+a cache of prepared statements, so a helper call costs only the query itself.
+"""
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import chatbot.globals as gl
+
+BUSY_TIMEOUT = 5000  # Milliseconds to wait for a lock held by another connection
+STATEMENT_CACHE_SIZE = 256
+
+_local = threading.local()
+_connections = []
+_connections_lock = threading.Lock()
+_generation = 0  # Increased by close_all, so threads open a new connection afterwards
+
+
+def get_connection() -> sqlite3.Connection:
+    """
+    Return the connection of the current thread, opening it on first use.
+
+    Returns:
+        sqlite3.Connection: A configured connection to gl.DB_FILE.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.key == (gl.DB_FILE, _generation):
+        return conn
+
+    # The connection is only used by this thread, close_all may close it from another one
+    # Transactions are opened explicitly by transaction(), so DDL is transactional too
+    conn = sqlite3.connect(gl.DB_FILE, timeout=BUSY_TIMEOUT / 1000, isolation_level=None,
+                           cached_statements=STATEMENT_CACHE_SIZE, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT}")
+    _local.conn, _local.key = conn, (gl.DB_FILE, _generation)
+    with _connections_lock:
+        _connections.append(conn)
+    return conn
+
+
+@contextmanager
+def connection():
+    """
+    Provide a cursor for read queries.
+
+    Yields:
+        sqlite3.Cursor: Cursor of the current thread's connection.
+    """
+    cursor = get_connection().cursor()
+    try:
+        yield cursor
+    finally:
+        cursor.close()
+
+
+@contextmanager
+def transaction():
+    """
+    Provide a cursor whose statements are committed together, or rolled back on error.
+
+    Yields:
+        sqlite3.Cursor: Cursor of the current thread's connection.
+    """
+    cursor = get_connection().cursor()
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            yield cursor
+        except BaseException:
+            cursor.execute("ROLLBACK")
+            raise
+        cursor.execute("COMMIT")
+    finally:
+        cursor.close()
+
+
+def close_all() -> None:
+    """Close every connection opened by get_connection."""
+    global _generation
+    with _connections_lock:
+        for conn in _connections:
+            conn.close()
+        _connections.clear()
+        _generation += 1
@@ -1,229 +1,233 @@
-import sqlite3
-from datetime import datetime
+from db.connection import connection, transaction
+from db.migrations import migrate, run_backfills
 
-import chatbot.globals as gl
+# Results of a webinar registration
+REGISTERED, ALREADY_REGISTERED, WEBINAR_FULL = "registered", "already_registered", "full"
 
 
 # Connect to the SQLite database (it will create it if it doesn't exist)
 def create_db_and_tables():
-    conn = sqlite3.connect(gl.DB_FILE)
-    cursor = conn.cursor()
-
-    # Create 'users' table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_chat_id INTEGER UNIQUE NOT NULL
-    )
-    ''')
-
-    # Create 'scheduled_messages' table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS scheduled_messages (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        scheduled_time TEXT NOT NULL, 
-        message TEXT NOT NULL,
-        images_ids TEXT
-    )
-    ''')
-
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS webinars (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        webinar_data TEXT NOT NULL,
-        webinar_url TEXT NOT NULL
-    )
-    ''')
-
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS webinars_users (
-           id INTEGER PRIMARY KEY AUTOINCREMENT,
-           user_chat_id INTEGER NOT NULL,
-           webinar_data DATETIME NOT NULL,
-           webinar_url TEXT
-       )
-    ''')
-
-    conn.commit()
-    conn.close()
-
-
-def insert_user(user_chat_id):
-    conn = sqlite3.connect(gl.DB_FILE)
-    cursor = conn.cursor()
-
-    cursor.execute('''
-    INSERT OR IGNORE INTO users (user_chat_id) 
-    VALUES (?)
-    ''', (user_chat_id,))
-
-    conn.commit()
-    conn.close()
-
-
-def insert_scheduled_message(scheduled_time, message, image=None):
-    conn = sqlite3.connect(gl.DB_FILE)
-    cursor = conn.cursor()
-
-    cursor.execute('''
-    INSERT INTO scheduled_messages (scheduled_time, message, images_ids) 
-    VALUES (?, ?, ?)
-    ''', (scheduled_time, message, image))
-
-    conn.commit()
-    conn.close()
+    migrate()
+    run_backfills()
+
+
+def insert_users(user_chat_ids):
+    # A known user who was inactive is active again
+    with transaction() as cursor:
+        cursor.executemany('''
+        INSERT INTO users (user_chat_id)
+        VALUES (?)
+        ON CONFLICT (user_chat_id) DO UPDATE SET active = 1 WHERE active = 0
+        ''', [(user_chat_id,) for user_chat_id in user_chat_ids])
+
+
+def deactivate_users(user_chat_ids):
+    with transaction() as cursor:
+        cursor.executemany('''
+        UPDATE users SET active = 0 WHERE user_chat_id = ? AND active = 1
+        ''', [(user_chat_id,) for user_chat_id in user_chat_ids])
+
+
+def insert_scheduled_message(scheduled_time, scheduled_at, message, image=None):
+    with transaction() as cursor:
+        cursor.execute('''
+        INSERT INTO scheduled_messages (scheduled_time, scheduled_at, message, images_ids) 
+        VALUES (?, ?, ?, ?)
+        ''', (scheduled_time, scheduled_at, message, image))
+        message_id = cursor.lastrowid
+
+    return message_id
 
 
 def get_all_chat_ids_from_db():
     """
-    Extracts all chat IDs from a SQLite database.
-
-    Args:
-        db_path (str): Path to the SQLite database file.
+    Extracts the chat IDs of all active users from a SQLite database.
 
     Returns:
         list: A list of chat IDs.
     """
-    conn = sqlite3.connect(gl.DB_FILE)
-    cursor = conn.cursor()
-
-    # Replace 'users' with your actual table name and 'chat_id' with your actual column name
-    cursor.execute('SELECT user_chat_id FROM users')
-    chat_ids = [row[0] for row in cursor.fetchall()]
+    with connection() as cursor:
+        cursor.execute('SELECT user_chat_id FROM users WHERE active = 1')
+        chat_ids = [row[0] for row in cursor.fetchall()]
 
-    conn.close()
     return chat_ids
 
 
-def set_webinar_data(webinar_data, webinar_url):
-    conn = sqlite3.connect(gl.DB_FILE)
-    cursor = conn.cursor()
+def get_chat_id_page(after_user_id=0, page_size=500):
+    """
+    Extracts a page of active users ordered by user id.
 
-    # Check if a row already exists
-    cursor.execute('SELECT COUNT(*) FROM webinars')
-    row_count = cursor.fetchone()[0]
+    Args:
+        after_user_id (int): Only users with a greater id are returned.
+        page_size (int): Number of users in a page.
 
-    if row_count > 0:
-        # Update existing row
+    Returns:
+        list: A list of (user id, chat id) rows.
+    """
+    with connection() as cursor:
         cursor.execute('''
-        UPDATE webinars
-        SET webinar_data = ?, webinar_url = ?
-        ''', (webinar_data, webinar_url))
-    else:
-        # Insert new row
+        SELECT id, user_chat_id FROM users
+        WHERE active = 1 AND id > ?
+        ORDER BY id
+        LIMIT ?
+        ''', (after_user_id, page_size))
+        page = cursor.fetchall()
+
+    return page
+
+
+def insert_webinar(webinar_data, webinar_url, starts_at, capacity=None):
+    with transaction() as cursor:
         cursor.execute('''
-        INSERT INTO webinars (webinar_data, webinar_url) 
-        VALUES (?, ?)
-        ''', (webinar_data, webinar_url))
+        INSERT INTO webinars (webinar_data, webinar_url, starts_at, capacity)
+        VALUES (?, ?, ?, ?)
+        ''', (webinar_data, webinar_url, starts_at, capacity))
+        webinar_id = cursor.lastrowid
 
-    conn.commit()
-    conn.close()
+    return webinar_id
+
+
+def get_upcoming_webinars(now):
+    """
+    Extracts the webinars that have not started yet, ordered by start time.
+
+    Args:
+        now (int): Current time in epoch seconds.
 
+    Returns:
+        list: A list of (id, webinar data, url, start time, capacity, number of registrations) rows.
+    """
+    with connection() as cursor:
+        cursor.execute('''
+        SELECT id, webinar_data, webinar_url, starts_at, capacity,
+               (SELECT COUNT(*) FROM webinars_users WHERE webinar_id = webinars.id)
+        FROM webinars
+        WHERE starts_at > ?
+        ORDER BY starts_at
+        ''', (now,))
+        rows = cursor.fetchall()
 
-def get_webinar_data() -> str | None:
-    conn = sqlite3.connect(gl.DB_FILE)
-    cursor = conn.cursor()
+    return rows
 
-    # Replace 'users' with your actual table name and 'chat_id' with your actual column name
-    cursor.execute('SELECT webinar_data FROM webinars')
-    webinar_data = cursor.fetchall()
-    if not webinar_data:
-        return None
 
-    conn.close()
-    return webinar_data.pop()
+def delete_webinar(cursor, webinar_id):
+    """Delete the webinar with its registrations, in the transaction that cancels its reminders."""
+    cursor.execute('DELETE FROM webinars_users WHERE webinar_id = ?', (webinar_id,))
+    cursor.execute('DELETE FROM webinars WHERE id = ?', (webinar_id,))
 
 
-def delete_webinar_data():
-    conn = sqlite3.connect(gl.DB_FILE)
-    cursor = conn.cursor()
+def delete_past_webinars(before):
+    """
+    Deletes the webinars that started before the given time together with their registrations.
 
-    # Delete the row
-    cursor.execute('DELETE FROM webinars')
+    Args:
+        before (int): Epoch seconds.
 
-    conn.commit()
-    conn.close()
+    Returns:
+        int: Number of deleted webinars.
+    """
+    with transaction() as cursor:
+        cursor.execute('SELECT id FROM webinars WHERE starts_at < ?', (before,))
+        webinar_ids = [row[0] for row in cursor.fetchall()]
+        for webinar_id in webinar_ids:
+            delete_webinar(cursor, webinar_id)
 
+    return len(webinar_ids)
 
-def get_webinars_info():
-    conn = sqlite3.connect(gl.DB_FILE)
-    cursor = conn.cursor()
 
-    # Retrieve the data from the 'webinars' table
-    cursor.execute('SELECT webinar_data, webinar_url FROM webinars LIMIT 1')
-    row = cursor.fetchone()
+def get_scheduled_message(message_id):
+    with connection() as cursor:
+        cursor.execute('''
+        SELECT message, images_ids, last_user_id FROM scheduled_messages
+        WHERE id = ?
+        ''', (message_id,))
+        row = cursor.fetchone()
 
-    conn.close()
     return row
 
 
-def get_all_scheduled_messages():
-    conn = sqlite3.connect(gl.DB_FILE)
-    cursor = conn.cursor()
-
-    # Select all columns and rows from the 'scheduled_messages' table
-    cursor.execute('SELECT scheduled_time,message,images_ids FROM scheduled_messages')
+def set_scheduled_message_cursor(message_id, last_user_id):
+    with transaction() as cursor:
+        cursor.execute('''
+        UPDATE scheduled_messages
+        SET last_user_id = ?
+        WHERE id = ?
+        ''', (last_user_id, message_id))
 
-    # Fetch all rows from the result set
-    rows = cursor.fetchall()
 
-    conn.close()
+def delete_scheduled_message(message_id):
+    with transaction() as cursor:
+        cursor.execute('DELETE FROM scheduled_messages WHERE id = ?', (message_id,))
 
-    # Return the list of rows, where each row is a list of column values
-    return rows
 
+def insert_webinar_user(user_chat_id, date_obj, webinar_url, webinar_id):
+    """
+    Registers the user for the webinar if it has a free place, a repeated registration changes nothing.
 
-def delete_scheduled_message_by_time(scheduled_time):
-    conn = sqlite3.connect(gl.DB_FILE)
-    cursor = conn.cursor()
+    The places are counted in the same transaction as the insert, so concurrent
+    registrations cannot overbook the webinar.
 
-    # Delete the row where 'scheduled_time' matches the provided value
-    cursor.execute('''
-    DELETE FROM scheduled_messages
-    WHERE scheduled_time = ?
-    ''', (scheduled_time,))
+    Returns:
+        str: REGISTERED, ALREADY_REGISTERED, or WEBINAR_FULL if the webinar has no free
+            place or no longer exists.
+    """
+    with transaction() as cursor:
+        cursor.execute('''
+        INSERT INTO webinars_users (user_chat_id, webinar_data, remind_at, webinar_url, webinar_id)
+        SELECT ?, ?, ?, ?, id FROM webinars
+        WHERE id = ? AND (capacity IS NULL
+                          OR (SELECT COUNT(*) FROM webinars_users WHERE webinar_id = webinars.id) < capacity)
+        ON CONFLICT (webinar_id, user_chat_id) DO NOTHING
+        ''', (user_chat_id, date_obj.isoformat(" "), int(date_obj.timestamp()), webinar_url, webinar_id))
+        if cursor.rowcount == 1:
+            return REGISTERED
 
-    conn.commit()
-    conn.close()
+        cursor.execute('SELECT 1 FROM webinars_users WHERE webinar_id = ? AND user_chat_id = ?',
+                       (webinar_id, user_chat_id))
+        return ALREADY_REGISTERED if cursor.fetchone() else WEBINAR_FULL
 
 
-def insert_webinar_user(user_chat_id, date_obj, webinar_url):
-    conn = sqlite3.connect(gl.DB_FILE)
-    cursor = conn.cursor()
+def get_reminder_recipients_page(webinar_id, remind_at, after_id=0, page_size=500):
+    """
+    Extracts a page of the webinar registrants reminded at the given time, ordered by registration id.
 
-    # Insert data into 'webinars_users'
-    cursor.execute('''
-    INSERT INTO webinars_users (user_chat_id, webinar_data, webinar_url) 
-    VALUES (?, ?, ?)
-    ''', (user_chat_id, date_obj, webinar_url))
+    Args:
+        webinar_id (int): Id of the webinar.
+        remind_at (int): Reminder time in epoch seconds.
+        after_id (int): Only registrations with a greater id are returned.
+        page_size (int): Number of registrations in a page.
 
-    conn.commit()
-    conn.close()
+    Returns:
+        list: A list of (registration id, chat id) rows.
+    """
+    with connection() as cursor:
+        cursor.execute('''
+        SELECT id, user_chat_id FROM webinars_users
+        WHERE remind_at = ? AND webinar_id IS ? AND id > ?
+        ORDER BY id
+        LIMIT ?
+        ''', (remind_at, webinar_id, after_id, page_size))
+        page = cursor.fetchall()
 
+    return page
 
-def get_future_webinars_and_delete_past():
-    conn = sqlite3.connect(gl.DB_FILE)
-    cursor = conn.cursor()
 
-    # Get the current datetime
-    now = datetime.now(gl.TIMEZONE)
+def get_all_media_files():
+    with connection() as cursor:
+        cursor.execute('SELECT path, content_hash, file_id FROM media_files')
+        rows = cursor.fetchall()
 
-    # Retrieve all rows where 'webinar_data' is in the future
-    cursor.execute('''
-    SELECT user_chat_id, webinar_data, webinar_url FROM webinars_users 
-    WHERE webinar_data > ?
-    ''', (now,))
+    return rows
 
-    future_webinars = cursor.fetchall()
 
-    # Delete rows where 'webinar_data' is in the past
-    cursor.execute('''
-    DELETE FROM webinars_users 
-    WHERE webinar_data <= ?
-    ''', (now,))
+def set_media_file(path, content_hash, file_id):
+    with transaction() as cursor:
+        cursor.execute('''
+        INSERT OR REPLACE INTO media_files (path, content_hash, file_id)
+        VALUES (?, ?, ?)
+        ''', (path, content_hash, file_id))
 
-    conn.commit()
-    conn.close()
 
-    # Return the future webinars
-    return future_webinars
+def delete_media_files(paths):
+    with transaction() as cursor:
+        cursor.executemany('DELETE FROM media_files WHERE path = ?', [(path,) for path in paths])
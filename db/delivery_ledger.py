@@ -0,0 +1,129 @@
+"""
+Ledger of the messages sent by broadcasts and webinar reminders.
+
+Every recipient of a broadcast or a reminder gets a row in the deliveries table with
+the job it belongs to, the delivery status, the class of the Telegram error, the
+number of attempts and the latency. The rows are collected in memory and written in
+one transaction per DELIVERIES_FLUSH_ROWS rows and at the end of every page of
+recipients, so the ledger costs no database work per message. Rows older than
+DELIVERIES_MAX_AGE are deleted with the writes.
+"""
+import logging
+import time
+from collections import namedtuple
+
+import chatbot.globals as gl
+import db.async_database as adb
+from db.connection import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+# Aggregates of the deliveries of one job
+JobStats = namedtuple("JobStats", ["source", "source_id", "total", "sent", "blocked", "failed",
+                                   "attempts", "latency_ms", "started_at", "finished_at"])
+
+
+def insert_deliveries(rows, max_age):
+    with transaction() as cursor:
+        cursor.executemany('''
+        INSERT INTO deliveries (source, source_id, chat_id, status, error, attempts, latency_ms, finished_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+        cursor.execute('DELETE FROM deliveries WHERE finished_at < ?', (time.time() - max_age,))
+
+
+def get_job_stats(limit=5):
+    """
+    Aggregates the deliveries of the latest jobs.
+
+    Args:
+        limit (int): Number of jobs.
+
+    Returns:
+        list: JobStats of the jobs, the latest first.
+    """
+    with connection() as cursor:
+        cursor.execute('''
+        SELECT source, source_id, COUNT(*),
+               SUM(status = 'sent'), SUM(status = 'blocked'), SUM(status = 'failed'),
+               AVG(attempts), AVG(latency_ms), MIN(finished_at - latency_ms / 1000.0), MAX(finished_at)
+        FROM deliveries
+        GROUP BY source, source_id
+        ORDER BY MAX(id) DESC
+        LIMIT ?
+        ''', (limit,))
+        rows = cursor.fetchall()
+
+    return [JobStats(*row) for row in rows]
+
+
+def get_error_counts(since, limit=5):
+    """
+    Counts the failed deliveries by error class.
+
+    Args:
+        since (float): Only deliveries finished after this time are counted.
+        limit (int): Number of error classes.
+
+    Returns:
+        list: A list of (error class, count) rows, the most frequent first.
+    """
+    with connection() as cursor:
+        cursor.execute('''
+        SELECT error, COUNT(*) FROM deliveries
+        WHERE finished_at > ? AND error IS NOT NULL
+        GROUP BY error
+        ORDER BY COUNT(*) DESC
+        LIMIT ?
+        ''', (since, limit))
+        rows = cursor.fetchall()
+
+    return rows
+
+
+class DeliveryLedger:
+    """
+    Buffer of delivery rows that are not in the database yet.
+
+    Args:
+        max_rows (int): Number of pending rows that triggers a write right away.
+        max_age (int): Seconds after which a row is deleted.
+    """
+
+    def __init__(self, max_rows: int = gl.DELIVERIES_FLUSH_ROWS, max_age: int = gl.DELIVERIES_MAX_AGE):
+        self.max_rows = max_rows
+        self.max_age = max_age
+        self.pending = []
+
+    async def add(self, source: str, source_id: int, delivery) -> None:
+        """
+        Queue the delivery to one chat for the database.
+
+        Args:
+            source (str): Kind of the job that sent the message.
+            source_id (int): Id of the job.
+            delivery (Delivery): Outcome of the delivery.
+        """
+        self.pending.append((source, source_id, delivery.chat_id, delivery.state, delivery.error,
+                             delivery.attempts, round(delivery.latency * 1000), time.time()))
+        if len(self.pending) >= self.max_rows:
+            await self.flush()
+
+    async def flush(self, context=None) -> None:
+        """
+        Write all pending rows in one transaction.
+
+        Can be used directly as a JobQueue callback.
+        """
+        if not self.pending:
+            return
+        rows, self.pending = self.pending, []
+        try:
+            await adb.run(insert_deliveries, rows, self.max_age)
+        except Exception:
+            # Keep the rows for the next flush
+            self.pending = rows + self.pending
+            logger.exception("Failed to write %s deliveries", len(rows))
+
+
+delivery_ledger = DeliveryLedger()
@@ -0,0 +1,307 @@
+"""
+Durable store of the scheduled jobs.
+
+Webinar reminders and broadcasts used to live only in the JobQueue, and every start
+rebuilt them from the webinars_users and scheduled_messages tables. Now every such
+job is a row of the jobs table with its kind, the id of the entity it works on, the
+chat, the time it runs at and its status, and every status change is a transaction.
+
+The JobQueue only holds the jobs that run soon: at startup and then every
+JOBS_POLL_INTERVAL seconds the store loads the jobs due before the next load in
+pages ordered by time, so the startup cost does not depend on how many jobs are
+stored. Jobs interrupted by a shutdown are resumed, jobs missed by more than
+JOBS_MISFIRE_GRACE seconds are expired.
+
+A cancel updates the jobs table and the tables of the cancelled entity in the same
+transaction, then removes the cancelled jobs that are already in the JobQueue.
+"""
+import json
+import logging
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from telegram.ext import ContextTypes, JobQueue
+
+import chatbot.globals as gl
+import db.async_database as adb
+from chatbot.lifecycle import cancellable
+from db.connection import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+# Job kinds
+REMINDER, BROADCAST = "reminder", "broadcast"
+# Job statuses, pending and running jobs are loaded at startup
+PENDING, RUNNING, DONE, FAILED, CANCELLED, EXPIRED = "pending", "running", "done", "failed", "cancelled", "expired"
+
+# cursor is the progress of a job that serves many chats, e.g. the last served registrant
+StoredJob = namedtuple("StoredJob", ["id", "kind", "entity_id", "chat_id", "run_at", "payload", "cursor"],
+                       defaults=[None])
+
+
+def _row_to_job(row) -> StoredJob:
+    job_id, kind, entity_id, chat_id, run_at, payload, job_cursor = row
+    return StoredJob(job_id, kind, entity_id, chat_id, run_at, json.loads(payload) if payload else None, job_cursor)
+
+
+def insert_job(kind, run_at, entity_id=None, chat_id=None, payload=None, unique=False):
+    """Store a pending job. With unique a job that has not run yet with the same key is returned instead."""
+    with transaction() as cursor:
+        if unique:
+            cursor.execute('''
+            SELECT id, kind, entity_id, chat_id, run_at, payload, cursor FROM jobs
+            WHERE kind = ? AND entity_id IS ? AND chat_id IS ? AND run_at = ? AND status = ?
+            ''', (kind, entity_id, chat_id, run_at, PENDING))
+            row = cursor.fetchone()
+            if row is not None:
+                return _row_to_job(row)
+
+        cursor.execute('''
+        INSERT INTO jobs (kind, entity_id, chat_id, run_at, status, payload, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (kind, entity_id, chat_id, run_at, PENDING,
+              None if payload is None else json.dumps(payload), int(time.time())))
+        job_id = cursor.lastrowid
+
+    return StoredJob(job_id, kind, entity_id, chat_id, run_at, payload)
+
+
+def set_job_status(job_id, status):
+    with transaction() as cursor:
+        cursor.execute('UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?',
+                       (status, int(time.time()), job_id))
+
+
+def set_job_cursor(job_id, job_cursor):
+    with transaction() as cursor:
+        cursor.execute('UPDATE jobs SET cursor = ?, updated_at = ? WHERE id = ?',
+                       (job_cursor, int(time.time()), job_id))
+
+
+def expire_jobs(before):
+    """Expire the pending jobs that should have run before the given time and drop their messages."""
+    with transaction() as cursor:
+        cursor.execute('''
+        SELECT id, kind, entity_id FROM jobs
+        WHERE status = ? AND run_at < ?
+        ''', (PENDING, before))
+        rows = cursor.fetchall()
+        cursor.executemany('UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?',
+                           [(EXPIRED, int(time.time()), job_id) for job_id, _, _ in rows])
+        cursor.executemany('DELETE FROM scheduled_messages WHERE id = ?',
+                           [(entity_id,) for _, kind, entity_id in rows if kind == BROADCAST])
+
+    return len(rows)
+
+
+def delete_finished_jobs(before):
+    """Delete the jobs that finished, failed, expired or were cancelled before the given time."""
+    with transaction() as cursor:
+        # Matches the condition of idx_jobs_finished
+        cursor.execute('''
+        DELETE FROM jobs
+        WHERE status IN ('done', 'failed', 'cancelled', 'expired') AND updated_at < ?
+        ''', (before,))
+        deleted = cursor.rowcount
+
+    return deleted
+
+
+def get_due_jobs_page(after, until, page_size):
+    """
+    Extracts a page of the pending and running jobs ordered by time.
+
+    Args:
+        after (tuple): (run_at, id) of the last job of the previous page.
+        until (int): Only jobs running at or before this time are returned.
+        page_size (int): Number of jobs in a page.
+
+    Returns:
+        list: A list of StoredJob.
+    """
+    with connection() as cursor:
+        cursor.execute('''
+        SELECT id, kind, entity_id, chat_id, run_at, payload, cursor FROM jobs
+        WHERE status IN (?, ?) AND (run_at, id) > (?, ?) AND run_at <= ?
+        ORDER BY run_at, id
+        LIMIT ?
+        ''', (PENDING, RUNNING, *after, until, page_size))
+        rows = cursor.fetchall()
+
+    return [_row_to_job(row) for row in rows]
+
+
+def cancel_jobs(kind=None, entity_id=None, chat_id=None, cleanup=None):
+    """
+    Cancel the pending jobs matching every given filter.
+
+    Args:
+        kind (str): Job kind.
+        entity_id (int): Id of the entity the jobs work on.
+        chat_id (int): Chat the jobs are for.
+        cleanup (Callable[[sqlite3.Cursor], None]): Run in the same transaction, e.g. to
+            delete the rows of the cancelled entity.
+
+    Returns:
+        list: Ids of the cancelled jobs.
+    """
+    filters = {"kind": kind, "entity_id": entity_id, "chat_id": chat_id}
+    conditions = "".join(f" AND {column} = ?" for column, value in filters.items() if value is not None)
+    with transaction() as cursor:
+        cursor.execute(f'SELECT id FROM jobs WHERE status = ?{conditions}',
+                       (PENDING, *(value for value in filters.values() if value is not None)))
+        job_ids = [row[0] for row in cursor.fetchall()]
+        cursor.executemany('UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?',
+                           [(CANCELLED, int(time.time()), job_id) for job_id in job_ids])
+        if cleanup is not None:
+            cleanup(cursor)
+
+    return job_ids
+
+
+class JobStore:
+    """
+    Schedules the stored jobs in the JobQueue shortly before they are due.
+
+    A job callback gets the StoredJob as context.job.data and returns True when the
+    job is complete. Otherwise, e.g. for a broadcast stopped by a shutdown, the job
+    stays running and is resumed at the next start.
+
+    Args:
+        poll_interval (float): Seconds between two loads of the due jobs.
+        misfire_grace (int): Seconds a missed job may be late and still run.
+        page_size (int): Number of jobs loaded per query.
+    """
+
+    def __init__(self, poll_interval=gl.JOBS_POLL_INTERVAL, misfire_grace=gl.JOBS_MISFIRE_GRACE,
+                 page_size=gl.JOBS_PAGE_SIZE):
+        self.poll_interval = poll_interval
+        self.misfire_grace = misfire_grace
+        self.page_size = page_size
+        self.callbacks = {}
+        self.job_queue = None
+        # Jobs due up to this time are in the JobQueue, None until the first load
+        self.loaded_until = None
+        # id of the stored job -> its JobQueue job
+        self.loaded = {}
+
+    def register(self, kind: str, callback) -> None:
+        """
+        Set the callback that runs the jobs of the kind.
+
+        Args:
+            kind (str): Job kind.
+            callback (Callable[[ContextTypes.DEFAULT_TYPE], Awaitable[bool]]): Runs a job.
+        """
+        self.callbacks[kind] = callback
+
+    async def start(self, job_queue: JobQueue) -> None:
+        """
+        Expire the missed jobs, load the due ones and start loading the next ones periodically.
+
+        Args:
+            job_queue (JobQueue): The queue the due jobs are added to.
+        """
+        self.job_queue = job_queue
+        expired = await adb.run(expire_jobs, int(time.time()) - self.misfire_grace)
+        if expired:
+            logger.warning("Expired %s jobs missed while the bot was stopped", expired)
+        await self.load()
+        job_queue.run_repeating(cancellable(self.load), interval=self.poll_interval, first=self.poll_interval)
+
+    async def load(self, context=None) -> None:
+        """
+        Add the jobs due before the next load to the JobQueue.
+
+        Can be used directly as a JobQueue callback.
+        """
+        # Moved before the query, so jobs scheduled meanwhile are added by schedule
+        after = (-1, 0) if self.loaded_until is None else (self.loaded_until, 2 ** 63 - 1)
+        self.loaded_until = int(time.time() + 2 * self.poll_interval)
+        count = 0
+        while page := await adb.run(get_due_jobs_page, after, self.loaded_until, self.page_size):
+            for job in page:
+                self._enqueue(job)
+            count += len(page)
+            after = (page[-1].run_at, page[-1].id)
+        if count:
+            logger.info("Loaded %s due jobs", count)
+
+    async def schedule(self, kind: str, when: datetime, entity_id=None, chat_id=None, payload=None,
+                       unique=False) -> StoredJob:
+        """
+        Store a job and add it to the JobQueue if it is due before the next load.
+
+        With unique the job is stored only once: scheduling it again while it has not
+        run yet returns the stored job.
+
+        Args:
+            kind (str): Job kind with a registered callback.
+            when (datetime): Time the job runs at.
+            entity_id (int): Id of the scheduled message, registration etc. the job works on.
+            chat_id (int): Chat the job is for.
+            payload (dict): JSON serializable data of the job.
+            unique (bool): Do not store the job again if the same job is pending.
+
+        Returns:
+            StoredJob: The stored job.
+        """
+        job = await adb.run(insert_job, kind, int(when.timestamp()), entity_id, chat_id, payload, unique)
+        if self.loaded_until is not None and job.run_at <= self.loaded_until:
+            self._enqueue(job)
+        return job
+
+    async def set_cursor(self, job_id: int, job_cursor: int) -> None:
+        """
+        Store the progress of a running job, so it is resumed from there after a restart.
+
+        Args:
+            job_id (int): Id of the stored job.
+            job_cursor (int): Progress of the job, e.g. the id of the last served registrant.
+        """
+        await adb.run(set_job_cursor, job_id, job_cursor)
+
+    async def cancel(self, kind=None, entity_id=None, chat_id=None, cleanup=None) -> int:
+        """
+        Cancel the pending jobs matching every given filter.
+
+        Args:
+            kind (str): Job kind.
+            entity_id (int): Id of the entity the jobs work on.
+            chat_id (int): Chat the jobs are for.
+            cleanup (Callable[[sqlite3.Cursor], None]): Run in the transaction of the cancel,
+                e.g. to delete the rows of the cancelled entity.
+
+        Returns:
+            int: Number of cancelled jobs.
+        """
+        job_ids = await adb.run(cancel_jobs, kind, entity_id, chat_id, cleanup)
+        for job_id in job_ids:
+            if job_id in self.loaded:
+                self.loaded.pop(job_id).schedule_removal()
+        return len(job_ids)
+
+    def _enqueue(self, job: StoredJob) -> None:
+        if job.id in self.loaded:
+            return
+        when = datetime.fromtimestamp(max(job.run_at, time.time()), gl.TIMEZONE)
+        queued = self.job_queue.run_once(cancellable(self._run), when=when, data=job, chat_id=job.chat_id,
+                                         name=f"{job.kind}:{job.entity_id}")
+        self.loaded[job.id] = queued
+
+    async def _run(self, context: ContextTypes.DEFAULT_TYPE) -> None:
+        job = context.job.data
+        await adb.run(set_job_status, job.id, RUNNING)
+        try:
+            complete = await self.callbacks[job.kind](context)
+        except Exception:
+            await adb.run(set_job_status, job.id, FAILED)
+            raise
+        finally:
+            self.loaded.pop(job.id, None)
+        if complete:
+            await adb.run(set_job_status, job.id, DONE)
+
+
+job_store = JobStore()
@@ -0,0 +1,407 @@
+"""
+Versioned schema migrations for the bot database.
+
+MIGRATIONS is an ordered list, and the version of the last applied migration is kept
+in PRAGMA user_version. On startup every newer migration is applied in its own
+transaction together with the version bump, so a failed migration leaves the
+database at the previous version. Upgrades only change the schema and must stay
+fast. Data that has to be rewritten row by row is handled by the migration's
+backfill, which processes a small batch per transaction. The backfills run at
+startup before the bot accepts updates, since the rows a handler stores in between
+would look like unconverted ones. A finished backfill is recorded and never runs again.
+
+Upgrades are written to be idempotent, because databases created before the runner
+existed are at version 0 while already having some of the tables and columns.
+"""
+import json
+import logging
+import time
+from collections import namedtuple
+from datetime import datetime
+
+import chatbot.globals as gl
+from db.connection import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_BATCH_SIZE = 500
+
+# upgrade(cursor) changes the schema; backfill(cursor, batch_size) rewrites up to
+# batch_size rows and returns how many it rewrote, 0 once there is nothing left.
+Migration = namedtuple("Migration", ["version", "description", "upgrade", "backfill"], defaults=[None])
+
+
+def add_column_if_missing(cursor, table, column, column_type):
+    cursor.execute(f'PRAGMA table_info({table})')
+    if column not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}')
+
+
+def _create_base_tables(cursor):
+    # Create 'users' table
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_chat_id INTEGER UNIQUE NOT NULL
+    )
+    ''')
+
+    # Create 'scheduled_messages' table
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS scheduled_messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        scheduled_time TEXT NOT NULL,
+        message TEXT NOT NULL,
+        images_ids TEXT
+    )
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS webinars (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        webinar_data TEXT NOT NULL,
+        webinar_url TEXT NOT NULL
+    )
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS webinars_users (
+           id INTEGER PRIMARY KEY AUTOINCREMENT,
+           user_chat_id INTEGER NOT NULL,
+           webinar_data DATETIME NOT NULL,
+           webinar_url TEXT
+       )
+    ''')
+
+
+def _add_broadcast_cursor(cursor):
+    # Id of the last user that got the broadcast, NULL until the broadcast starts
+    add_column_if_missing(cursor, 'scheduled_messages', 'last_user_id', 'INTEGER')
+
+
+def _create_media_files(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS media_files (
+        path TEXT PRIMARY KEY,
+        content_hash TEXT NOT NULL,
+        file_id TEXT NOT NULL
+    )
+    ''')
+
+
+def _add_epoch_timestamps(cursor):
+    add_column_if_missing(cursor, 'scheduled_messages', 'scheduled_at', 'INTEGER')
+    add_column_if_missing(cursor, 'webinars_users', 'remind_at', 'INTEGER')
+
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_scheduled_messages_scheduled_at '
+                   'ON scheduled_messages (scheduled_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_webinars_users_remind_at ON webinars_users (remind_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_webinars_users_user_chat_id ON webinars_users (user_chat_id)')
+
+
+def _backfill_epoch_timestamps(cursor, batch_size):
+    cursor.execute('SELECT id, scheduled_time FROM scheduled_messages WHERE scheduled_at IS NULL LIMIT ?',
+                   (batch_size,))
+    messages = [
+        (int(gl.TIMEZONE.localize(datetime.strptime(scheduled_time, "%d.%m.%Y %H:%M")).timestamp()), row_id)
+        for row_id, scheduled_time in cursor.fetchall()
+    ]
+    cursor.executemany('UPDATE scheduled_messages SET scheduled_at = ? WHERE id = ?', messages)
+
+    cursor.execute('SELECT id, webinar_data FROM webinars_users WHERE remind_at IS NULL LIMIT ?', (batch_size,))
+    reminders = [
+        (int(datetime.fromisoformat(webinar_data).timestamp()), row_id)
+        for row_id, webinar_data in cursor.fetchall()
+    ]
+    cursor.executemany('UPDATE webinars_users SET remind_at = ? WHERE id = ?', reminders)
+
+    return len(messages) + len(reminders)
+
+
+def _create_persistence_tables(cursor):
+    # JSON encoded user_data, chat_data and bot_data of the application
+    for table in ('persistence_user_data', 'persistence_chat_data'):
+        cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS {table} (
+            id INTEGER PRIMARY KEY,
+            data TEXT NOT NULL,
+            updated_at INTEGER NOT NULL
+        )
+        ''')
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_updated_at ON {table} (updated_at)')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS persistence_bot_data (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        data TEXT NOT NULL
+    )
+    ''')
+
+    # Current state of every conversation that has not ended, key is the JSON encoded key tuple
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS persistence_conversations (
+        name TEXT NOT NULL,
+        key TEXT NOT NULL,
+        state TEXT NOT NULL,
+        updated_at INTEGER NOT NULL,
+        PRIMARY KEY (name, key)
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_persistence_conversations_updated_at '
+                   'ON persistence_conversations (updated_at)')
+
+
+def _create_jobs(cursor):
+    # Scheduled reminders and broadcasts, entity_id is the id of the webinars_users or
+    # scheduled_messages row the job works on
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        entity_id INTEGER,
+        chat_id INTEGER,
+        run_at INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        payload TEXT,
+        updated_at INTEGER NOT NULL
+    )
+    ''')
+    # Only the jobs that still have to run are looked up by time
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_due ON jobs (run_at, id) "
+                   "WHERE status IN ('pending', 'running')")
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_jobs_kind_entity_id ON jobs (kind, entity_id)')
+
+
+def _backfill_jobs(cursor, batch_size):
+    now = int(time.time())
+    # Broadcasts that started before a restart are resumed
+    cursor.execute('''
+    INSERT INTO jobs (kind, entity_id, run_at, status, updated_at)
+    SELECT 'broadcast', id, scheduled_at, CASE WHEN last_user_id IS NULL THEN 'pending' ELSE 'running' END, ?
+    FROM scheduled_messages
+    WHERE scheduled_at IS NOT NULL
+      AND NOT EXISTS (SELECT 1 FROM jobs WHERE kind = 'broadcast' AND entity_id = scheduled_messages.id)
+    LIMIT ?
+    ''', (now, batch_size))
+    return cursor.rowcount
+
+
+def _group_reminders(cursor):
+    # Id of the last registrant that got the reminder of a bucket
+    add_column_if_missing(cursor, 'jobs', 'cursor', 'INTEGER')
+    # Reminders used to be a job per registrant, the backfill replaces them with a job per bucket
+    cursor.execute('''
+    UPDATE jobs SET status = 'cancelled'
+    WHERE kind = 'reminder' AND chat_id IS NOT NULL AND status IN ('pending', 'running')
+    ''')
+
+
+def _backfill_reminder_buckets(cursor, batch_size):
+    now = int(time.time())
+    # With MAX the bare webinar_url column is taken from the latest registration of the bucket
+    cursor.execute('''
+    SELECT remind_at, webinar_id, webinar_url, MAX(id) FROM webinars_users
+    WHERE remind_at > ?
+      AND NOT EXISTS (SELECT 1 FROM jobs WHERE kind = 'reminder' AND chat_id IS NULL
+                      AND run_at = webinars_users.remind_at AND entity_id IS webinars_users.webinar_id)
+    GROUP BY remind_at, webinar_id
+    LIMIT ?
+    ''', (now, batch_size))
+    # Keyed like the bucket job a registration schedules, so the same bucket is never stored twice
+    buckets = [
+        ('reminder', webinar_id, remind_at, 'pending', json.dumps({"url": webinar_url}), now)
+        for remind_at, webinar_id, webinar_url, _ in cursor.fetchall()
+    ]
+    cursor.executemany('''
+    INSERT INTO jobs (kind, entity_id, run_at, status, payload, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ''', buckets)
+
+    return len(buckets)
+
+
+def _link_registrations(cursor):
+    # Registrations and reminder jobs belong to a webinar, so cancelling it removes only its own
+    add_column_if_missing(cursor, 'webinars_users', 'webinar_id', 'INTEGER')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_webinars_users_webinar_id ON webinars_users (webinar_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_jobs_chat_id ON jobs (chat_id) WHERE chat_id IS NOT NULL')
+
+
+def _backfill_registration_links(cursor, batch_size):
+    # Registrations with the URL of the current webinar belong to it
+    cursor.execute('''
+    SELECT id FROM webinars_users
+    WHERE webinar_id IS NULL AND webinar_url IN (SELECT webinar_url FROM webinars)
+    LIMIT ?
+    ''', (batch_size,))
+    registrations = [(row_id,) for row_id, in cursor.fetchall()]
+    cursor.executemany('''
+    UPDATE OR IGNORE webinars_users
+    SET webinar_id = (SELECT id FROM webinars WHERE webinar_url = webinars_users.webinar_url)
+    WHERE id = ?
+    ''', registrations)
+    # A row the unique index keeps from being linked is a repeated registration of a linked user
+    cursor.executemany('DELETE FROM webinars_users WHERE id = ? AND webinar_id IS NULL', registrations)
+
+    cursor.execute('''
+    UPDATE jobs
+    SET entity_id = (SELECT webinar_id FROM webinars_users WHERE remind_at = jobs.run_at AND webinar_id IS NOT NULL)
+    WHERE kind = 'reminder' AND entity_id IS NULL AND status IN ('pending', 'running')
+      AND EXISTS (SELECT 1 FROM webinars_users WHERE remind_at = jobs.run_at AND webinar_id IS NOT NULL)
+    ''')
+
+    return len(registrations) + cursor.rowcount
+
+
+def _add_webinar_schedule(cursor):
+    # Several webinars can be planned, each with its start time and an optional number of places
+    add_column_if_missing(cursor, 'webinars', 'starts_at', 'INTEGER')
+    add_column_if_missing(cursor, 'webinars', 'capacity', 'INTEGER')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_webinars_starts_at ON webinars (starts_at)')
+
+    # There is at most one webinar from before, so its start time is set right here
+    cursor.execute('SELECT id, webinar_data FROM webinars WHERE starts_at IS NULL')
+    cursor.executemany('UPDATE webinars SET starts_at = ? WHERE id = ?', [
+        (int(gl.TIMEZONE.localize(datetime.strptime(webinar_data, "%d.%m.%Y %H:%M")).timestamp()), row_id)
+        for row_id, webinar_data in cursor.fetchall()
+    ])
+
+
+def _unique_registrations(cursor):
+    # A user is registered for a webinar once, the first registration is kept
+    cursor.execute('''
+    DELETE FROM webinars_users
+    WHERE webinar_id IS NOT NULL AND id NOT IN (
+        SELECT MIN(id) FROM webinars_users WHERE webinar_id IS NOT NULL GROUP BY webinar_id, user_chat_id
+    )
+    ''')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_webinars_users_webinar_id_user_chat_id '
+                   'ON webinars_users (webinar_id, user_chat_id)')
+    # Covered by the unique index
+    cursor.execute('DROP INDEX IF EXISTS idx_webinars_users_webinar_id')
+
+
+def _create_deliveries(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS deliveries (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        source TEXT NOT NULL,
+        source_id INTEGER NOT NULL,
+        chat_id INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        error TEXT,
+        attempts INTEGER NOT NULL,
+        latency_ms INTEGER NOT NULL,
+        finished_at REAL NOT NULL
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_deliveries_source ON deliveries (source, source_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_deliveries_finished_at ON deliveries (finished_at)')
+
+
+def _add_user_activity(cursor):
+    # Users who blocked the bot are skipped by broadcasts until they send /start again
+    add_column_if_missing(cursor, 'users', 'active', 'INTEGER NOT NULL DEFAULT 1')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_active ON users (id, user_chat_id) WHERE active = 1')
+
+    # Users whose last delivery was blocked are inactive right away
+    cursor.execute('''
+    UPDATE users SET active = 0 WHERE user_chat_id IN (
+        SELECT chat_id FROM (SELECT chat_id, status, MAX(id) FROM deliveries GROUP BY chat_id)
+        WHERE status = 'blocked'
+    )
+    ''')
+
+
+def _index_history(cursor):
+    # Finished jobs are deleted periodically, started webinars are found by idx_webinars_starts_at
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs (updated_at) "
+                   "WHERE status IN ('done', 'failed', 'cancelled', 'expired')")
+
+
+def _create_finished_backfills(cursor):
+    # Version of every migration whose backfill has nothing left to rewrite
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS finished_backfills (
+        version INTEGER PRIMARY KEY,
+        finished_at INTEGER NOT NULL
+    )
+    ''')
+
+
+MIGRATIONS = [
+    Migration(1, "Base tables", _create_base_tables),
+    Migration(2, "Broadcast resume cursor", _add_broadcast_cursor),
+    Migration(3, "Telegram file_id cache", _create_media_files),
+    Migration(4, "Epoch timestamp columns and indexes", _add_epoch_timestamps, _backfill_epoch_timestamps),
+    Migration(5, "Conversation and user data persistence", _create_persistence_tables),
+    Migration(6, "Durable job store", _create_jobs, _backfill_jobs),
+    Migration(7, "Webinar reminders grouped by time", _group_reminders, _backfill_reminder_buckets),
+    Migration(8, "Registrations and reminders linked to their webinar", _link_registrations,
+              _backfill_registration_links),
+    Migration(9, "Webinar start time and capacity", _add_webinar_schedule),
+    Migration(10, "One registration per user and webinar", _unique_registrations),
+    Migration(11, "Delivery ledger", _create_deliveries),
+    Migration(12, "Inactive users", _add_user_activity),
+    Migration(13, "Finished jobs index", _index_history),
+    Migration(14, "Finished backfills", _create_finished_backfills),
+]
+
+
+def get_schema_version() -> int:
+    with connection() as cursor:
+        cursor.execute('PRAGMA user_version')
+        return cursor.fetchone()[0]
+
+
+def migrate(migrations=MIGRATIONS) -> None:
+    """
+    Apply every migration newer than the current schema version.
+
+    Args:
+        migrations (list): Migrations ordered by version.
+    """
+    current = get_schema_version()
+    for migration in migrations:
+        if migration.version <= current:
+            continue
+        with transaction() as cursor:
+            migration.upgrade(cursor)
+            cursor.execute(f'PRAGMA user_version = {int(migration.version)}')
+        logger.info("Applied migration %s: %s", migration.version, migration.description)
+
+
+def backfill_batch(batch_size=BACKFILL_BATCH_SIZE, migrations=MIGRATIONS) -> int:
+    """
+    Run one batch of the first unfinished backfill in a transaction.
+
+    A backfill that rewrites no rows is recorded as finished in the same transaction.
+
+    Args:
+        batch_size (int): Maximum number of rows rewritten.
+        migrations (list): Migrations ordered by version.
+
+    Returns:
+        int: Number of rewritten rows, 0 when every backfill is finished.
+    """
+    with connection() as cursor:
+        cursor.execute('SELECT version FROM finished_backfills')
+        finished = {version for version, in cursor.fetchall()}
+    for migration in migrations:
+        if migration.backfill is None or migration.version in finished:
+            continue
+        with transaction() as cursor:
+            rows = migration.backfill(cursor, batch_size)
+            if not rows:
+                cursor.execute('INSERT INTO finished_backfills (version, finished_at) VALUES (?, ?)',
+                               (migration.version, int(time.time())))
+        if rows:
+            return rows
+        logger.info("Finished backfill of migration %s: %s", migration.version, migration.description)
+    return 0
+
+
+def run_backfills(batch_size=BACKFILL_BATCH_SIZE) -> None:
+    """Run the unfinished backfills batch by batch until every one is finished."""
+    while backfill_batch(batch_size):
+        pass
@@ -0,0 +1,169 @@
+"""
+SQLite persistence for the conversation states and user data of the bot.
+
+The nightly restart used to drop everybody who was in the middle of a conversation.
+SQLitePersistence keeps the states and user_data in the bot database, so a restart
+continues every conversation where it stopped.
+
+The application asks for changed data every update_interval seconds. The changes of
+one such round are collected and written in a single transaction on the database
+thread, so the handlers never wait for the disk. The application copies the stored
+data into memory once at startup, so instead of reading everything ever stored only
+the live sessions are loaded: ended conversations and empty user data are deleted
+right away, and data untouched for PERSISTENCE_MAX_AGE is pruned before loading.
+"""
+import asyncio
+import json
+import logging
+import time
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+import chatbot.globals as gl
+import db.async_database as adb
+from db.connection import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+_DATA_TABLES = {"user_data": "persistence_user_data", "chat_data": "persistence_chat_data"}
+
+
+def _load(kind, max_age):
+    table = _DATA_TABLES[kind]
+    with transaction() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE updated_at < ?', (int(time.time()) - max_age,))
+        cursor.execute(f'SELECT id, data FROM {table}')
+        rows = cursor.fetchall()
+
+    return {row_id: json.loads(data) for row_id, data in rows}
+
+
+def _load_bot_data():
+    with connection() as cursor:
+        cursor.execute('SELECT data FROM persistence_bot_data WHERE id = 1')
+        row = cursor.fetchone()
+
+    return json.loads(row[0]) if row else {}
+
+
+def _load_conversations(name, max_age):
+    with transaction() as cursor:
+        cursor.execute('DELETE FROM persistence_conversations WHERE updated_at < ?', (int(time.time()) - max_age,))
+        cursor.execute('SELECT key, state FROM persistence_conversations WHERE name = ?', (name,))
+        rows = cursor.fetchall()
+
+    return {tuple(json.loads(key)): json.loads(state) for key, state in rows}
+
+
+def _write(changes):
+    """Write the collected changes in one transaction, None values are deletions."""
+    now = int(time.time())
+    with transaction() as cursor:
+        for (kind, key), value in changes.items():
+            if kind == "bot_data":
+                cursor.execute('INSERT OR REPLACE INTO persistence_bot_data (id, data) VALUES (1, ?)',
+                               (json.dumps(value),))
+            elif kind in _DATA_TABLES:
+                table = _DATA_TABLES[kind]
+                if value:
+                    cursor.execute(f'INSERT OR REPLACE INTO {table} (id, data, updated_at) VALUES (?, ?, ?)',
+                                   (key, json.dumps(value), now))
+                else:
+                    cursor.execute(f'DELETE FROM {table} WHERE id = ?', (key,))
+            else:
+                name, conversation_key = key
+                if value is None:
+                    cursor.execute('DELETE FROM persistence_conversations WHERE name = ? AND key = ?',
+                                   (name, conversation_key))
+                else:
+                    cursor.execute('''
+                    INSERT OR REPLACE INTO persistence_conversations (name, key, state, updated_at)
+                    VALUES (?, ?, ?, ?)
+                    ''', (name, conversation_key, json.dumps(value), now))
+
+
+class SQLitePersistence(BasePersistence):
+    """
+    BasePersistence implementation that stores the data in the bot database.
+
+    All stored data has to be JSON serializable. Callback data is not stored.
+
+    Args:
+        update_interval (float): Seconds between two writes of the changed data.
+        max_age (int): Seconds after which untouched data is no longer loaded.
+    """
+
+    def __init__(self, update_interval=gl.PERSISTENCE_UPDATE_INTERVAL, max_age=gl.PERSISTENCE_MAX_AGE):
+        super().__init__(store_data=PersistenceInput(callback_data=False), update_interval=update_interval)
+        self.max_age = max_age
+        self._changes = {}
+        self._write_task = None
+
+    def _stage(self, kind, key, value) -> None:
+        # The application hands over all changes of a round at once, so writing them in a
+        # task that runs after the current step batches the whole round in one transaction.
+        self._changes[(kind, key)] = value
+        if self._write_task is None or self._write_task.done():
+            self._write_task = asyncio.create_task(self._write_changes())
+
+    async def _write_changes(self) -> None:
+        while self._changes:
+            changes, self._changes = self._changes, {}
+            try:
+                await adb.run(_write, changes)
+            except Exception:
+                logger.exception("Failed to persist %s changes", len(changes))
+                # Newer changes win over the failed ones
+                self._changes = {**changes, **self._changes}
+                return
+
+    async def get_user_data(self) -> dict:
+        return await adb.run(_load, "user_data", self.max_age)
+
+    async def get_chat_data(self) -> dict:
+        return await adb.run(_load, "chat_data", self.max_age)
+
+    async def get_bot_data(self) -> dict:
+        return await adb.run(_load_bot_data)
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name: str) -> dict:
+        return await adb.run(_load_conversations, name, self.max_age)
+
+    async def update_conversation(self, name: str, key: tuple, new_state) -> None:
+        self._stage("conversation", (name, json.dumps(list(key))), new_state)
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        self._stage("user_data", user_id, data)
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        self._stage("chat_data", chat_id, data)
+
+    async def update_bot_data(self, data: dict) -> None:
+        self._stage("bot_data", None, data)
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._stage("user_data", user_id, None)
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self._stage("chat_data", chat_id, None)
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
+
+    async def flush(self) -> None:
+        """Write the remaining changes, called by the application on shutdown."""
+        if self._write_task is not None:
+            await self._write_task
+        await self._write_changes()
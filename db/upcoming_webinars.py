@@ -0,0 +1,102 @@
+"""
+In-memory read model of the upcoming webinars.
+
+The webinar menu is opened far more often than the admin changes a webinar, so the
+upcoming webinars are loaded from the database once and then served from memory,
+together with their number of registrations. Every admin write goes through this
+module and drops the loaded list, so the next read loads it again. Webinars that
+have started are filtered out on read.
+"""
+import functools
+import time
+from collections import namedtuple
+from datetime import datetime
+
+import db.async_database as adb
+from db import database
+from db.job_store import job_store, REMINDER
+
+Webinar = namedtuple("Webinar", ["id", "date_text", "url", "starts_at", "capacity"])
+
+
+class UpcomingWebinars:
+    """Upcoming webinars and their number of registrations, loaded on first use."""
+
+    def __init__(self):
+        self.webinars = None
+        # webinar id -> number of registrations
+        self.registered = {}
+        # Increased by every write, so a load that raced with a write is not kept
+        self.version = 0
+
+    async def all(self) -> list:
+        """
+        Return the webinars that have not started yet.
+
+        Returns:
+            list: Webinar tuples ordered by start time.
+        """
+        if self.webinars is None:
+            version = self.version
+            rows = await adb.get_upcoming_webinars(int(time.time()))
+            if version == self.version:
+                self.webinars = [Webinar(*row[:5]) for row in rows]
+                self.registered = {row[0]: row[5] for row in rows}
+            else:
+                return await self.all()
+        now = time.time()
+        return [webinar for webinar in self.webinars if webinar.starts_at > now]
+
+    async def get(self, webinar_id: int):
+        """
+        Return the upcoming webinar with the id.
+
+        Args:
+            webinar_id (int): Id of the webinar.
+
+        Returns:
+            Webinar: The webinar, or None if it does not exist or has started.
+        """
+        return next((webinar for webinar in await self.all() if webinar.id == webinar_id), None)
+
+    def is_full(self, webinar: Webinar) -> bool:
+        return webinar.capacity is not None and self.registered.get(webinar.id, 0) >= webinar.capacity
+
+    def count_registration(self, webinar_id: int) -> None:
+        """Count a new registration without reloading the webinars."""
+        self.registered[webinar_id] = self.registered.get(webinar_id, 0) + 1
+
+    def invalidate(self) -> None:
+        self.webinars = None
+        self.version += 1
+
+    async def add(self, date_text: str, url: str, starts_at: datetime, capacity=None) -> int:
+        """
+        Store a new webinar.
+
+        Args:
+            date_text (str): The start time as the admin entered it.
+            url (str): Link to the webinar.
+            starts_at (datetime): Start time of the webinar.
+            capacity (int): Maximum number of registrations, None for no limit.
+
+        Returns:
+            int: Id of the new webinar.
+        """
+        webinar_id = await adb.insert_webinar(date_text, url, int(starts_at.timestamp()), capacity)
+        self.invalidate()
+        return webinar_id
+
+    async def remove(self, webinar_id: int) -> None:
+        """
+        Delete the webinar with its registrations and cancel its reminders.
+
+        Args:
+            webinar_id (int): Id of the webinar.
+        """
+        await job_store.cancel(REMINDER, entity_id=webinar_id,
+                               cleanup=functools.partial(database.delete_webinar, webinar_id=webinar_id))
+        self.invalidate()
+
+
+upcoming_webinars = UpcomingWebinars()
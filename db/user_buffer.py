@@ -0,0 +1,93 @@
+"""
+Write-behind buffer for the users table.
+
+The chat ids of all active users are loaded into memory at startup, so a repeated
+/start costs no database work. New chat ids are collected in a buffer and written in a
+single transaction every USERS_FLUSH_INTERVAL seconds, as soon as USERS_FLUSH_ROWS
+are pending, and once more on shutdown.
+
+Users a broadcast could not reach are marked inactive the same way, and broadcasts
+skip them. An inactive user is not in the known set, so their next /start makes
+them active again.
+"""
+import logging
+
+import chatbot.globals as gl
+import db.async_database as adb
+from db.database import get_all_chat_ids_from_db
+
+logger = logging.getLogger(__name__)
+
+
+class UserBuffer:
+    """
+    Known active users set with buffers of user changes that are not in the database yet.
+
+    Args:
+        max_rows (int): Number of pending users that triggers a write right away.
+    """
+
+    def __init__(self, max_rows: int = gl.USERS_FLUSH_ROWS):
+        self.max_rows = max_rows
+        self.known = set()
+        self.pending = []
+        # Chat ids to mark inactive
+        self.blocked = set()
+
+    def load(self) -> None:
+        """Load the chat ids of all active users from the database."""
+        self.known = set(get_all_chat_ids_from_db())
+
+    async def add(self, user_chat_id: int) -> None:
+        """
+        Remember the user and queue it for the database if it is new.
+
+        Args:
+            user_chat_id (int): Chat id of the user.
+        """
+        if user_chat_id in self.known:
+            return
+        self.known.add(user_chat_id)
+        self.blocked.discard(user_chat_id)
+        self.pending.append(user_chat_id)
+        if len(self.pending) >= self.max_rows:
+            await self.flush()
+
+    async def deactivate(self, user_chat_id: int) -> None:
+        """
+        Forget the user and queue it to be marked inactive.
+
+        Args:
+            user_chat_id (int): Chat id of the user who can no longer be reached.
+        """
+        self.known.discard(user_chat_id)
+        self.blocked.add(user_chat_id)
+        if len(self.blocked) >= self.max_rows:
+            await self.flush()
+
+    async def flush(self, context=None) -> None:
+        """
+        Write all pending users, then all pending deactivations, one transaction each.
+
+        Can be used directly as a JobQueue callback.
+        """
+        if self.pending:
+            rows, self.pending = self.pending, []
+            try:
+                await adb.insert_users(rows)
+            except Exception:
+                # Keep the users for the next flush
+                self.pending = rows + self.pending
+                logger.exception("Failed to write %s new users", len(rows))
+
+        if self.blocked:
+            blocked, self.blocked = self.blocked, set()
+            try:
+                await adb.deactivate_users(list(blocked))
+            except Exception:
+                # Users who sent /start in the meantime stay active
+                self.blocked |= blocked - self.known
+                logger.exception("Failed to deactivate %s users", len(blocked))
+
+
+user_buffer = UserBuffer()
@@ -1,6 +1,9 @@
 #!/bin/bash
-#Kill any running instance of the Python script
-pkill -f chatbot/main.py
+# The new instance starts up, asks the running one to shut down gracefully with SIGTERM
+# and takes over as soon as it has exited, so no updates or scheduled jobs are lost.
+# The running bot keeps its pid in dynamic/bot.pid, the shell that started it is PID 1
+# of the container and must not be signalled
+OLD_PID=$(cat /app/dynamic/bot.pid 2>/dev/null)
 
 # Start the script again
-cd /app && export PYTHONPATH=/app && /usr/local/bin/python chatbot/main.py
\ No newline at end of file
+cd /app && export PYTHONPATH=/app && REPLACE_PID=${OLD_PID:-0} /usr/local/bin/python chatbot/main.py
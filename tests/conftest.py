@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The bot reads static/ and dynamic/ relative to the repository root
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+
+import chatbot.globals as gl  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A migrated database in a temporary folder."""
+    from db.connection import close_all
+    from db.migrations import migrate
+
+    monkeypatch.setattr(gl, "DB_FILE", str(tmp_path / "bots_info.db"))
+    migrate()
+    yield gl.DB_FILE
+    close_all()
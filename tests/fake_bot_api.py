@@ -0,0 +1,32 @@
+"""A local Bot API server for the tests, answering every method and recording the calls."""
+from contextlib import asynccontextmanager
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from telegram.ext import ApplicationBuilder
+
+
+def fake_bot_api(calls: list) -> web.Application:
+    async def handle(request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        data = dict(await request.post()) if request.content_type != "application/json" else await request.json()
+        calls.append((method, data))
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "bot", "username": "bot"}
+        elif method == "getUpdates":
+            result = []
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", handle)
+    return app
+
+
+@asynccontextmanager
+async def bot_api_application(calls: list, builder=None):
+    """Yield an application built against the fake Bot API, not initialized yet."""
+    async with TestServer(fake_bot_api(calls)) as api:
+        builder = builder or ApplicationBuilder().updater(None)
+        yield builder.token("1:abc").base_url(str(api.make_url("/bot"))).build()
@@ -0,0 +1,74 @@
+import asyncio
+
+from telegram.error import Forbidden
+
+import chatbot.broadcast as broadcast
+from chatbot.broadcast import Broadcaster, BLOCKED, FAILED, SENT
+
+PAYLOAD = {"texts": ["hello"], "photos": []}
+
+
+class FakeBot:
+    def __init__(self, error_for=None):
+        self.error_for = error_for or (lambda chat_id: None)
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        error = self.error_for(chat_id)
+        if error:
+            raise error
+        self.sent.append(chat_id)
+
+
+async def pages(count, page_size=10):
+    for start in range(1, count + 1, page_size):
+        yield [(user_id, user_id) for user_id in range(start, min(start + page_size, count + 1))]
+
+
+def run(bot, count, **kwargs):
+    broadcaster = Broadcaster(bot, rate=10000, chat_rate=10000, chat_burst=10, concurrency=3)
+    return asyncio.run(asyncio.wait_for(broadcaster.run(pages(count), PAYLOAD, **kwargs), timeout=5))
+
+
+def test_delivers_to_every_recipient():
+    bot = FakeBot()
+    report = run(bot, 25)
+    assert sorted(bot.sent) == list(range(1, 26))
+    assert report.counts[SENT] == 25
+
+
+def test_unexpected_error_is_recorded_as_failed():
+    report = run(FakeBot(lambda chat_id: KeyError(chat_id)), 25)
+    assert report.counts[FAILED] == 25
+    assert not report.interrupted
+
+
+def test_failing_bookkeeping_does_not_stop_the_broadcast(monkeypatch):
+    async def broken(*args):
+        raise RuntimeError("ledger is down")
+
+    monkeypatch.setattr(broadcast.user_buffer, "deactivate", broken)
+    monkeypatch.setattr(broadcast.delivery_ledger, "add", broken)
+    report = run(FakeBot(lambda chat_id: Forbidden("blocked") if chat_id % 2 else None), 20,
+                 source=("broadcast", 1))
+    assert report.counts[BLOCKED] == 10
+    assert report.counts[SENT] == 10
+
+
+class WorkerKilled(BaseException):
+    pass
+
+
+def test_lost_worker_is_replaced(monkeypatch):
+    lost = []
+
+    def record(self, delivery):
+        if not lost:
+            lost.append(delivery.chat_id)
+            # Not an Exception, so it ends the worker
+            raise WorkerKilled
+        self.counts[delivery.state] += 1
+
+    monkeypatch.setattr(broadcast.BroadcastReport, "record", record)
+    report = run(FakeBot(), 25)
+    assert report.counts[SENT] == 24
@@ -0,0 +1,103 @@
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from db import database, migrations
+from db import job_store as job_store_db
+from db.connection import connection, transaction
+from db.database import ALREADY_REGISTERED, REGISTERED, WEBINAR_FULL
+
+REMIND_AT = datetime.datetime(2030, 1, 1, 17, 0)
+
+
+def register(webinar_id, user_chat_id):
+    return database.insert_webinar_user(user_chat_id, REMIND_AT, "https://example.com", webinar_id)
+
+
+def test_registration_stops_at_capacity(db):
+    webinar_id = database.insert_webinar("01.01.2030 18:00", "https://example.com", 1893513600, capacity=2)
+
+    assert register(webinar_id, 1) == REGISTERED
+    assert register(webinar_id, 1) == ALREADY_REGISTERED
+    assert register(webinar_id, 2) == REGISTERED
+    assert register(webinar_id, 3) == WEBINAR_FULL
+    assert register(webinar_id, 2) == ALREADY_REGISTERED
+
+
+def test_registration_without_capacity_is_unlimited(db):
+    webinar_id = database.insert_webinar("01.01.2030 18:00", "https://example.com", 1893513600)
+
+    assert all(register(webinar_id, user_chat_id) == REGISTERED for user_chat_id in range(50))
+
+
+def test_concurrent_registrations_do_not_overbook(db):
+    webinar_id = database.insert_webinar("01.01.2030 18:00", "https://example.com", 1893513600, capacity=5)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda user_chat_id: register(webinar_id, user_chat_id), range(40)))
+
+    assert results.count(REGISTERED) == 5
+    assert results.count(WEBINAR_FULL) == 35
+    assert database.get_upcoming_webinars(0)[0][5] == 5
+
+
+def test_removed_webinar_takes_no_registrations(db):
+    assert register(12345, 1) == WEBINAR_FULL
+
+
+def test_past_webinars_are_deleted_with_their_registrations(db):
+    past = database.insert_webinar("01.01.2020 18:00", "https://example.com", 1577894400)
+    upcoming = database.insert_webinar("01.01.2030 18:00", "https://example.com", 1893513600)
+    for webinar_id in (past, upcoming):
+        register(webinar_id, 1)
+
+    assert database.delete_past_webinars(1600000000) == 1
+    assert [row[0] for row in database.get_upcoming_webinars(0)] == [upcoming]
+    with connection() as cursor:
+        cursor.execute('SELECT webinar_id FROM webinars_users')
+        assert cursor.fetchall() == [(upcoming,)]
+
+
+def test_finished_jobs_are_deleted_through_the_index(db):
+    for status, updated_at in (("done", 100), ("expired", 100), ("cancelled", 100), ("failed", 100),
+                               ("pending", 100), ("running", 100), ("done", 300)):
+        job_id = job_store_db.insert_job("reminder", 1000, 1, None, {}).id
+        with connection() as cursor:
+            cursor.execute('UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?', (status, updated_at, job_id))
+
+    assert job_store_db.delete_finished_jobs(200) == 4
+    with connection() as cursor:
+        cursor.execute('SELECT status FROM jobs ORDER BY id')
+        assert [row[0] for row in cursor.fetchall()] == ["pending", "running", "done"]
+        cursor.execute("EXPLAIN QUERY PLAN DELETE FROM jobs "
+                       "WHERE status IN ('done', 'failed', 'cancelled', 'expired') AND updated_at < 200")
+        assert "idx_jobs_finished" in str(cursor.fetchall())
+
+
+def reminder_jobs():
+    with connection() as cursor:
+        cursor.execute("SELECT id, entity_id, run_at FROM jobs WHERE kind = 'reminder'")
+        return cursor.fetchall()
+
+
+def test_backfills_run_only_once(db):
+    migrations.run_backfills()
+    with connection() as cursor:
+        cursor.execute('SELECT version FROM finished_backfills ORDER BY version')
+        assert [row[0] for row in cursor.fetchall()] == [4, 6, 7, 8]
+
+    # A registration whose bucket job is not scheduled yet is left to the handler
+    register(database.insert_webinar("01.01.2030 18:00", "https://example.com", 1893513600), 1)
+    assert migrations.backfill_batch() == 0
+    assert reminder_jobs() == []
+
+
+def test_reminder_backfill_stores_the_bucket_a_registration_schedules(db):
+    webinar_id = database.insert_webinar("01.01.2030 18:00", "https://example.com", 1893513600)
+    register(webinar_id, 1)
+    with transaction() as cursor:
+        assert migrations._backfill_reminder_buckets(cursor, 500) == 1
+
+    job = job_store_db.insert_job("reminder", int(REMIND_AT.timestamp()), webinar_id, None, {}, unique=True)
+    assert reminder_jobs() == [(job.id, webinar_id, int(REMIND_AT.timestamp()))]
+    with transaction() as cursor:
+        assert migrations._backfill_reminder_buckets(cursor, 500) == 0
@@ -0,0 +1,168 @@
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import pytest
+from telegram import Update
+from telegram.ext import ApplicationBuilder, TypeHandler
+
+import chatbot.globals as gl
+import chatbot.lifecycle as lifecycle
+from chatbot.update_processor import PerChatUpdateProcessor
+from fake_bot_api import bot_api_application
+
+UPDATE = {
+    "update_id": 1,
+    "message": {"message_id": 1, "date": 0, "text": "hi",
+                "chat": {"id": 42, "type": "private"}, "from": {"id": 42, "is_bot": False, "first_name": "x"}},
+}
+
+
+def slow_work(events: list, name: str, seconds: float):
+    async def work(*args):
+        events.append(f"{name} started")
+        try:
+            await asyncio.sleep(seconds)
+            events.append(f"{name} finished")
+        except asyncio.CancelledError:
+            # Cleanup that needs the loop, like writing a resume cursor
+            await asyncio.sleep(0.05)
+            events.append(f"{name} cancelled")
+            raise
+    return work
+
+
+def drain_with(seconds: float, timeout: float, monkeypatch) -> tuple:
+    monkeypatch.setattr(gl, "SHUTDOWN_TIMEOUT", timeout)
+    events, calls = [], []
+    builder = ApplicationBuilder().updater(None).concurrent_updates(PerChatUpdateProcessor(4, 16))
+
+    async def test():
+        async with bot_api_application(calls, builder) as application:
+            application.add_handler(TypeHandler(Update, slow_work(events, "update", seconds)))
+            await application.initialize()
+            await application.start()
+            application.job_queue.run_once(lifecycle.cancellable(slow_work(events, "job", seconds)), 0)
+            application.create_task(slow_work(events, "task", seconds)())
+            await application.update_queue.put(Update.de_json(UPDATE, application.bot))
+            while len(events) < 3:
+                await asyncio.sleep(0.01)
+
+            started = time.monotonic()
+            await lifecycle.drain(application)
+            elapsed = time.monotonic() - started
+            events.append("drained")
+            await application.shutdown()
+            return elapsed
+
+    return asyncio.run(test()), events
+
+
+def test_drain_lets_work_finish_within_the_deadline(monkeypatch):
+    elapsed, events = drain_with(0.2, 5, monkeypatch)
+    assert sorted(events[3:-1]) == ["job finished", "task finished", "update finished"]
+    assert elapsed < 2
+
+
+def test_drain_cancels_and_awaits_work_past_the_deadline(monkeypatch):
+    elapsed, events = drain_with(60, 0.3, monkeypatch)
+    # Every piece of work ended before the application was shut down
+    assert sorted(events[3:-1]) == ["job cancelled", "task cancelled", "update cancelled"]
+    assert events[-1] == "drained"
+    assert elapsed < 3
+
+
+class FakeReceiver:
+    def __init__(self, events: list):
+        self.events = events
+
+    async def listen(self):
+        self.events.append("listen")
+
+    async def start(self):
+        self.events.append("start")
+
+    async def stop(self):
+        self.events.append("stop")
+
+
+def start_old_bot(tmp_path):
+    # Looks like a running bot to take_over
+    script = tmp_path / "chatbot" / "main.py"
+    script.parent.mkdir()
+    script.write_text("import time\ntime.sleep(60)\n")
+    return subprocess.Popen([sys.executable, str(script)])
+
+
+def test_replacement_prepares_after_the_old_process_has_exited(tmp_path, monkeypatch):
+    old = start_old_bot(tmp_path)
+    monkeypatch.setattr(gl, "REPLACE_PID", old.pid)
+    monkeypatch.setattr(gl, "PID_FILE", str(tmp_path / "bot.pid"))
+    monkeypatch.setattr(lifecycle, "stopping", asyncio.Event())
+    events, calls = [], []
+
+    def prepare():
+        events.append("prepare, old process alive" if lifecycle._process_alive(old.pid) else "prepare")
+
+    async def post_stop(application):
+        with open(gl.PID_FILE) as pid_file:
+            events.append(f"pid file {pid_file.read()}")
+
+    async def post_init(application):
+        # Stop the bot right after it started, as the next restart would
+        asyncio.get_running_loop().call_later(0.2, os.kill, os.getpid(), signal.SIGTERM)
+
+    async def test():
+        builder = ApplicationBuilder().updater(None).post_init(post_init).post_stop(post_stop)
+        async with bot_api_application(calls, builder) as application:
+            await lifecycle.run(application, FakeReceiver(events), prepare=prepare)
+
+    try:
+        asyncio.run(test())
+    finally:
+        old.kill()
+        old.wait()
+
+    assert old.returncode == -signal.SIGTERM
+    assert events[:3] == ["listen", "prepare", "start"]
+    assert "stop" in events
+    assert f"pid file {os.getpid()}" in events
+    assert not os.path.exists(gl.PID_FILE)
+    assert "getMe" in [method for method, _ in calls]
+
+
+def test_take_over_leaves_other_processes_alone():
+    other = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"])
+    try:
+        for pid in (1, os.getpid(), other.pid):
+            asyncio.run(asyncio.wait_for(lifecycle.take_over(pid), timeout=5))
+        assert other.poll() is None
+    finally:
+        other.kill()
+        other.wait()
+
+
+def test_take_over_gives_up_on_a_process_that_survives_sigkill(monkeypatch):
+    signals = []
+    monkeypatch.setattr(lifecycle, "_is_bot_process", lambda pid: True)
+    monkeypatch.setattr(lifecycle, "_process_alive", lambda pid: True)
+    monkeypatch.setattr(os, "kill", lambda pid, signal_number: signals.append(signal_number))
+    monkeypatch.setattr(gl, "SHUTDOWN_TIMEOUT", -10)
+    monkeypatch.setattr(lifecycle, "KILL_GRACE", 0.1)
+
+    with pytest.raises(SystemExit):
+        asyncio.run(asyncio.wait_for(lifecycle.take_over(12345), timeout=5))
+    assert signals == [signal.SIGTERM, signal.SIGKILL]
+
+
+def test_take_over_exits_when_not_allowed_to_signal(monkeypatch):
+    def kill(pid, signal_number):
+        raise PermissionError
+
+    monkeypatch.setattr(lifecycle, "_is_bot_process", lambda pid: True)
+    monkeypatch.setattr(os, "kill", kill)
+    with pytest.raises(SystemExit):
+        asyncio.run(lifecycle.take_over(12345))
@@ -0,0 +1,119 @@
+import asyncio
+import os
+import threading
+from types import SimpleNamespace
+
+from PIL import Image
+
+import chatbot.globals as gl
+import chatbot.media as media
+
+
+def make_gallery(tmp_path, monkeypatch):
+    monkeypatch.setattr(gl, "IMAGE_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(gl, "IMAGE_MAX_SIDE", 256)
+    monkeypatch.setattr(media, "galleries", media.GalleryIndex())
+    monkeypatch.setattr(media, "buffers", media.BufferPool(64 * 1024 * 1024))
+    monkeypatch.setattr(media, "_derivatives", {})
+    monkeypatch.setattr(media, "_hashes", {})
+
+    folder = tmp_path / "gallery"
+    folder.mkdir()
+    # Noise does not compress, like a photo saved losslessly
+    Image.frombytes("RGB", (1024, 768), os.urandom(1024 * 768 * 3)).save(folder / "1.png")
+    # Already smaller than any JPEG of it
+    Image.new("RGB", (8, 8), "white").save(folder / "2.png")
+    return str(folder)
+
+
+def upload_sizes(folder):
+    return {os.path.basename(file.path): len(media._upload(file).media.input_file_content)
+            for file in media.galleries.files(folder)}
+
+
+def test_derivatives_shrink_the_uploads(tmp_path, monkeypatch):
+    folder = make_gallery(tmp_path, monkeypatch)
+    before = upload_sizes(folder)
+    media.build_derivatives([folder])
+    after = upload_sizes(folder)
+
+    assert before["1.png"] == os.path.getsize(os.path.join(folder, "1.png"))
+    assert after["1.png"] < before["1.png"] / 10
+    with Image.open(media._derivatives[os.path.join(folder, "1.png")]) as image:
+        assert max(image.size) <= 256
+    # The derivative of the small image is not smaller, so the image itself is uploaded
+    assert after["2.png"] == before["2.png"]
+
+
+def test_derivatives_that_are_not_smaller_are_not_converted_again(tmp_path, monkeypatch):
+    folder = make_gallery(tmp_path, monkeypatch)
+    media.build_derivatives([folder])
+    cached = {name: os.stat(os.path.join(gl.IMAGE_CACHE_DIR, name)).st_mtime_ns
+              for name in os.listdir(gl.IMAGE_CACHE_DIR)}
+    assert len(cached) == 2
+
+    media.build_derivatives([folder])
+    assert {name: os.stat(os.path.join(gl.IMAGE_CACHE_DIR, name)).st_mtime_ns
+            for name in os.listdir(gl.IMAGE_CACHE_DIR)} == cached
+
+
+def test_upload_falls_back_to_the_image_when_the_derivative_is_gone(tmp_path, monkeypatch):
+    folder = make_gallery(tmp_path, monkeypatch)
+    media.build_derivatives([folder])
+    file = media.galleries.files(folder)[0]
+    os.remove(media._derivatives[file.path])
+
+    assert len(media._upload(file).media.input_file_content) == file.size
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_media_group(self, chat_id, media):
+        self.sent.append([item.media if isinstance(item.media, str) else "upload" for item in media])
+        return [SimpleNamespace(photo=[SimpleNamespace(file_id=f"id-{len(self.sent)}-{index}")])
+                for index in range(len(media))]
+
+
+def test_image_overwritten_in_place_is_uploaded_again(tmp_path, monkeypatch, db):
+    folder = make_gallery(tmp_path, monkeypatch)
+    monkeypatch.setattr(media, "_file_ids", None)
+    bot = FakeBot()
+    asyncio.run(media.send_gallery(bot, 1, folder))
+    asyncio.run(media.send_gallery(bot, 1, folder))
+    assert bot.sent == [["upload", "upload"], ["id-1-0", "id-1-1"]]
+
+    folder_mtime = os.stat(folder).st_mtime_ns
+    Image.new("RGB", (8, 8), "black").save(os.path.join(folder, "2.png"))
+    os.utime(folder, ns=(folder_mtime, folder_mtime))
+    assert media.galleries.refresh([folder]) == [folder]
+    assert media.galleries.refresh([folder]) == []
+
+    asyncio.run(media.send_gallery(bot, 1, folder))
+    assert bot.sent[-1] == ["id-1-0", "upload"]
+
+
+def test_files_are_hashed_and_read_off_the_event_loop(tmp_path, monkeypatch, db):
+    folder = make_gallery(tmp_path, monkeypatch)
+    monkeypatch.setattr(media, "_file_ids", None)
+    threads = []
+    content_hash, get = media.content_hash, media.buffers.get
+
+    def record(function):
+        def wrapper(*args):
+            threads.append(threading.current_thread())
+            return function(*args)
+        return wrapper
+
+    monkeypatch.setattr(media, "content_hash", record(content_hash))
+    monkeypatch.setattr(media.buffers, "get", record(get))
+    bot = FakeBot()
+    asyncio.run(media.send_gallery(bot, 1, folder))
+    assert len(threads) == 4
+    assert threading.main_thread() not in threads
+
+    threads.clear()
+    asyncio.run(media.send_gallery(bot, 1, folder))
+    assert threads == []
+    assert bot.sent[-1] == ["id-1-0", "id-1-1"]
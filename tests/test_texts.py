@@ -0,0 +1,36 @@
+import json
+
+import pytest
+
+import chatbot.globals as gl
+from chatbot.texts import compile_texts
+
+
+def load_texts() -> dict:
+    with open(gl.PATH_TO_JSON_FILE, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def test_shipped_texts_are_valid():
+    compile_texts(load_texts())
+
+
+def test_missing_template_is_reported():
+    texts = load_texts()
+    del texts["webinar_places"]
+    with pytest.raises(ValueError, match="webinar_places"):
+        compile_texts(texts)
+
+
+def test_template_with_wrong_fields_is_rejected():
+    texts = load_texts()
+    texts["webinar_places"] = ", місць: {} з {}"
+    with pytest.raises(ValueError, match="webinar_places"):
+        compile_texts(texts)
+
+
+def test_template_with_broken_braces_is_rejected():
+    texts = load_texts()
+    texts["webinar_places"] = ", місць: {"
+    with pytest.raises(ValueError, match="webinar_places"):
+        compile_texts(texts)
@@ -0,0 +1,93 @@
+import asyncio
+
+from aiohttp.test_utils import TestClient, TestServer
+from telegram.ext import ApplicationBuilder
+
+import chatbot.globals as gl
+import chatbot.lifecycle as lifecycle
+import chatbot.main as main
+import chatbot.webhook as webhook
+from fake_bot_api import bot_api_application
+
+SECRET = "s3cret"
+UPDATE = {
+    "update_id": 7,
+    "message": {"message_id": 1, "date": 0, "text": "/start",
+                "chat": {"id": 42, "type": "private"}, "from": {"id": 42, "is_bot": False, "first_name": "x"}},
+}
+
+
+async def with_bot_api(test):
+    calls = []
+    async with bot_api_application(calls) as application:
+        await application.initialize()
+        try:
+            await test(application)
+        finally:
+            await application.shutdown()
+    return calls
+
+
+def post_updates(monkeypatch, headers_list):
+    monkeypatch.setattr(gl, "WEBHOOK_SECRET", SECRET)
+    statuses, queued = [], []
+
+    async def test(application):
+        async with TestClient(TestServer(webhook.make_web_app(application))) as client:
+            for headers in headers_list:
+                response = await client.post(gl.WEBHOOK_PATH, json=UPDATE, headers=headers)
+                statuses.append(response.status)
+        while not application.update_queue.empty():
+            queued.append(application.update_queue.get_nowait())
+
+    asyncio.run(with_bot_api(test))
+    return statuses, queued
+
+
+def test_updates_with_the_secret_are_queued(monkeypatch):
+    statuses, queued = post_updates(monkeypatch, [{webhook.SECRET_TOKEN_HEADER: SECRET}])
+    assert statuses == [200]
+    assert [update.update_id for update in queued] == [7]
+
+
+def test_updates_without_the_secret_are_rejected(monkeypatch):
+    statuses, queued = post_updates(monkeypatch, [{}, {webhook.SECRET_TOKEN_HEADER: "wrong"},
+                                                  {webhook.SECRET_TOKEN_HEADER: ""}])
+    assert statuses == [403, 403, 403]
+    assert queued == []
+
+
+def test_every_update_is_rejected_without_a_configured_secret(monkeypatch):
+    monkeypatch.setattr(gl, "WEBHOOK_SECRET", None)
+
+    async def test(application):
+        async with TestClient(TestServer(webhook.make_web_app(application))) as client:
+            response = await client.post(gl.WEBHOOK_PATH, json=UPDATE, headers={webhook.SECRET_TOKEN_HEADER: ""})
+            assert response.status == 403
+
+    asyncio.run(with_bot_api(test))
+
+
+def test_webhook_is_registered_with_the_secret(monkeypatch):
+    monkeypatch.setattr(gl, "WEBHOOK_SECRET", SECRET)
+    monkeypatch.setattr(gl, "WEBHOOK_URL", "https://example.com")
+
+    async def test(application):
+        await webhook.WebhookReceiver(application).start()
+
+    calls = asyncio.run(with_bot_api(test))
+    (method, data), = [call for call in calls if call[0] == "setWebhook"]
+    assert data["secret_token"] == SECRET
+    assert data["url"] == "https://example.com" + gl.WEBHOOK_PATH
+
+
+def test_webhook_mode_needs_a_secret(monkeypatch):
+    application = ApplicationBuilder().token("1:abc").updater(None).build()
+    monkeypatch.setattr(gl, "BOT_MODE", "webhook")
+    monkeypatch.setattr(gl, "WEBHOOK_URL", "https://example.com")
+
+    monkeypatch.setattr(gl, "WEBHOOK_SECRET", None)
+    assert isinstance(main.make_receiver(application), lifecycle.PollingReceiver)
+
+    monkeypatch.setattr(gl, "WEBHOOK_SECRET", SECRET)
+    assert isinstance(main.make_receiver(application), webhook.WebhookReceiver)
@@ -0,0 +1,55 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import chatbot.webinars as webinars
+from db.upcoming_webinars import Webinar, upcoming_webinars
+
+
+class FakeMessage:
+    def __init__(self, text):
+        self.text = text
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+
+
+@pytest.fixture
+def removed(monkeypatch):
+    removed = []
+    planned = [Webinar(webinar_id, "01.01.2030 18:00", "https://example.com", 1893513600, None)
+               for webinar_id in (5, 7)]
+
+    async def get(webinar_id):
+        return next((webinar for webinar in planned if webinar.id == webinar_id), None)
+
+    async def remove(webinar_id):
+        removed.append(webinar_id)
+
+    async def finish_registration_menu(update, context):
+        return "menu"
+
+    monkeypatch.setattr(upcoming_webinars, "all", lambda: asyncio.sleep(0, planned))
+    monkeypatch.setattr(upcoming_webinars, "get", get)
+    monkeypatch.setattr(upcoming_webinars, "remove", remove)
+    monkeypatch.setattr(webinars.reg, "finish_registration_menu", finish_registration_menu)
+    return removed
+
+
+def send(text):
+    update = SimpleNamespace(callback_query=None, message=FakeMessage(text))
+    return asyncio.run(webinars.registration_webinar_url(update, SimpleNamespace(user_data={})))
+
+
+@pytest.mark.parametrize("text, expected", [("-", [5]), ("-7", [7]), ("- 7", [7])])
+def test_minus_removes_a_webinar(removed, text, expected):
+    assert send(text) == "menu"
+    assert removed == expected
+
+
+@pytest.mark.parametrize("text", ["-abc", "-5x", "-1.5", "-²"])
+def test_malformed_removal_is_asked_again(removed, text):
+    assert send(text) == webinars.gl.SET_WEBINAR_URL
+    assert removed == []